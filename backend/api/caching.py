@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import UploadHistory
+
+# Views whose responses are cached per user; see invalidate_user_cache()
+CACHED_VIEWS = ('dashboard', 'history')
+
+def response_cache_key(view_name, user_id):
+    return f"api-response:{view_name}:{user_id}"
+
+def invalidate_user_cache(user_id):
+    """Drops every cached response of a user. Called once an upload or append commits."""
+    cache.delete_many([response_cache_key(name, user_id) for name in CACHED_VIEWS])
+
+def latest_upload_state(user):
+    """
+    Returns the id of the user's latest upload and when any of their uploads
+    last changed (a new upload or an append), or None.
+    """
+    uploads = UploadHistory.objects.filter(user=user)
+    last_change = uploads.order_by('-updated_at').values('updated_at')[:1]
+    return (uploads.order_by('-uploaded_at')
+            .values('id', changed_at=Subquery(last_change)).first())
+
+def upload_etag(state):
+    """Strong ETag that changes whenever any of the user's uploads change."""
+    if state is None:
+        return '"upload-none"'
+    return f'"upload-{state["id"]}-{int(state["changed_at"].timestamp() * 1_000_000)}"'
+
+class ConditionalUploadCacheMixin:
+    """
+    Conditional GET and server-side caching for views whose output depends
+    only on the user's uploads. A matching If-None-Match is answered
+    with 304 after a single indexed lookup; otherwise the payload comes from
+    the cache and is only rebuilt after the user's next upload or append.
+
+    Subclasses set `cache_name` and implement `build_payload(request, latest)`
+    (must return something picklable) and `render_payload(payload)`.
+    """
+    cache_name = None
+
+    def get(self, request, *args, **kwargs):
+        latest = latest_upload_state(request.user)
+        etag = upload_etag(latest)
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        key = response_cache_key(self.cache_name, request.user.id)
+        cached = cache.get(key)
+        if cached is not None and cached[0] == etag:
+            payload = cached[1]
+        else:
+            payload = self.build_payload(request, latest)
+            cache.set(key, (etag, payload), settings.RESPONSE_CACHE_TIMEOUT)
+
+        response = self.render_payload(payload)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
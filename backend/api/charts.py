@@ -0,0 +1,85 @@
+import numpy as np
+from django.db.models import Avg, Count, F, FloatField, IntegerField, Max, Min, Value
+from django.db.models.functions import Cast, Floor, Least
+
+from .flags import LIMIT_FLAGS, OUTLIER_FLAGS, flag_names, metric_mask
+from .models import Equipment
+from .stats import METRIC_FIELDS
+
+def top_equipment(dataset_id, metric, limit, descending=True):
+    """
+    The `limit` rows with the highest (or lowest) `metric`, served straight
+    from the (upload, metric) index.
+    """
+    direction = '-' if descending else ''
+    return list(Equipment.objects.filter(upload_id=dataset_id)
+                .order_by(f'{direction}{metric}', f'{direction}id')
+                .values('equipment_id', 'name', 'type', metric)[:limit])
+
+def critical_equipment(dataset_id, metric=None, limit=50):
+    """
+    Rows flagged at ingest (see flags.py), read through the (upload, flags)
+    index so normal rows are never touched: per-metric counts of limit
+    breaches and outliers, and up to `limit` flagged rows. With a `metric`,
+    only that metric's flagged rows are listed, highest value first.
+    """
+    flagged = Equipment.objects.filter(upload_id=dataset_id, flags__gt=0)
+
+    counts = {m: {'limit': 0, 'outlier': 0} for m in METRIC_FIELDS}
+    for row in flagged.values('flags').annotate(count=Count('id')).order_by():
+        for m in METRIC_FIELDS:
+            if row['flags'] & LIMIT_FLAGS[m]:
+                counts[m]['limit'] += row['count']
+            if row['flags'] & OUTLIER_FLAGS[m]:
+                counts[m]['outlier'] += row['count']
+
+    if metric:
+        rows = (flagged.annotate(hit=F('flags').bitand(metric_mask(metric))).filter(hit__gt=0)
+                .order_by(f'-{metric}', '-id'))
+    else:
+        rows = flagged.order_by('id')
+    results = list(rows.values('equipment_id', 'name', 'type', *METRIC_FIELDS, 'flags')[:limit])
+    for row in results:
+        row['flags'] = flag_names(row['flags'])
+    return {'metric': metric, 'counts': counts, 'results': results}
+
+def metric_histogram(dataset_id, metric, bins, low, high):
+    """
+    Fixed-width histogram of `metric` over [low, high], binned by the
+    database so only one row per non-empty bin comes back. Like
+    numpy.histogram, the last bin includes its right edge.
+    """
+    edges = np.linspace(low, high, bins + 1)
+    width = (high - low) / bins or 1.0
+    bin_index = Least(
+        Cast(Floor((F(metric) - Value(low)) / Value(width)), IntegerField()),
+        Value(bins - 1),
+    )
+    rows = (Equipment.objects.filter(upload_id=dataset_id, **{f'{metric}__gte': low, f'{metric}__lte': high})
+            .annotate(bin=bin_index).values('bin').annotate(count=Count('id')).order_by())
+
+    counts = np.zeros(bins, dtype=np.int64)
+    for row in rows:
+        # Rows whose bin the database can't compute (e.g. NaN values) are left out
+        if row['bin'] is not None:
+            counts[row['bin']] += row['count']
+    return {'metric': metric, 'edges': edges.tolist(), 'counts': counts.tolist()}
+
+def type_summaries(dataset_id):
+    """Row count and per-metric mean/min/max for each equipment type, in one GROUP BY."""
+    aggregates = {'count': Count('id')}
+    for metric in METRIC_FIELDS:
+        aggregates[f'{metric}__mean'] = Avg(metric, output_field=FloatField())
+        aggregates[f'{metric}__min'] = Min(metric)
+        aggregates[f'{metric}__max'] = Max(metric)
+    rows = (Equipment.objects.filter(upload_id=dataset_id)
+            .values('type').annotate(**aggregates).order_by('type'))
+
+    return [
+        {
+            'type': row['type'],
+            'count': row['count'],
+            **{m: {k: row[f'{m}__{k}'] for k in ('mean', 'min', 'max')} for m in METRIC_FIELDS},
+        }
+        for row in rows
+    ]
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from .models import Equipment
+from .services import EQUIPMENT_FIELDS, get_upload_aggregate
+from .snapshots import load_snapshot, write_snapshot
+from .stats import METRIC_FIELDS
+
+def _dataset_columns(upload):
+    """
+    The columns of an upload's dataset, read from its snapshot (written in
+    the background after ingest). A dataset without a current snapshot is
+    read from the DB once and snapshotted for the next comparison.
+    """
+    owner = upload.source if upload.source_id else upload
+    columns = load_snapshot(owner)
+    if columns is None:
+        columns = _load_columns(owner.id)
+        write_snapshot(owner, columns)
+    return columns
+
+def _load_columns(upload_id):
+    """
+    Reads an upload's equipment columns with a single cursor scan into numpy
+    arrays (object for text, float64 for metrics).
+    """
+    queryset = Equipment.objects.filter(upload_id=upload_id).order_by('id').values_list(*EQUIPMENT_FIELDS)
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    columns = zip(*rows) if rows else [()] * len(EQUIPMENT_FIELDS)
+    return {field: np.array(col, dtype=np.float64 if field in METRIC_FIELDS else object)
+            for field, col in zip(EQUIPMENT_FIELDS, columns)}
+
+def _number(value, kind=float):
+    """JSON-safe number: NaN (e.g. a type missing from one side) becomes None."""
+    if value is None or pd.isna(value):
+        return None
+    return kind(value)
+
+def _delta(base, value, kind=float):
+    """{'base', 'value', 'delta'}; `kind` int keeps counts integral."""
+    base, value = _number(base, kind), _number(value, kind)
+    return {'base': base, 'value': value,
+            'delta': None if base is None or value is None else value - base}
+
+def _metric_deltas(base_stats, stats):
+    """Deltas of every stored aggregate statistic (mean, std, percentiles, ...) per metric."""
+    return {
+        metric: {key: _delta(base_stats.get(metric, {}).get(key), value)
+                 for key, value in stats.get(metric, {}).items()}
+        for metric in METRIC_FIELDS
+    }
+
+def _type_table(columns):
+    frame = pd.DataFrame({f: columns[f] for f in ('type', *METRIC_FIELDS)})
+    grouped = frame.groupby('type', sort=True)
+    table = grouped[list(METRIC_FIELDS)].mean()
+    table.insert(0, 'count', grouped.size())
+    return table
+
+def _type_deltas(base_types, types):
+    """Per-type row counts and metric means side by side; a type on one side only gets None."""
+    joined = base_types.join(types, how='outer', lsuffix='_base', rsuffix='_value')
+    columns = ('count', *METRIC_FIELDS)
+    return [
+        {'type': type_name, **{c: _delta(row[f'{c}_base'], row[f'{c}_value'], int if c == 'count' else float)
+                               for c in columns}}
+        for type_name, row in joined.iterrows()
+    ]
+
+def _last_occurrences(columns):
+    """
+    Hashed index of the upload's equipment ids with the positions of their
+    last rows. Built once per dataset and kept in `columns`.
+    """
+    if 'index' not in columns:
+        # Plain object dtype: skips pandas' conversion of the ids to Arrow strings
+        ids = pd.Index(columns['equipment_id'], dtype=object)
+        keep = ~ids.duplicated(keep='last')
+        columns['index'] = ids[keep], np.flatnonzero(keep)
+    return columns['index']
+
+def _equipment_deltas(base, columns, sort_metric, limit):
+    """
+    Matches rows on equipment_id with one hash lookup (Index.get_indexer)
+    and diffs the metrics of the matched pairs column-wise. If an id repeats
+    within an upload, its last row counts.
+    """
+    base_ids, base_rows = _last_occurrences(base)
+    ids, rows = _last_occurrences(columns)
+    position = base_ids.get_indexer(ids)
+    matched = position >= 0
+    rows, base_rows = rows[matched], base_rows[position[matched]]
+
+    values = {m: columns[m][rows] for m in METRIC_FIELDS}
+    base_values = {m: base[m][base_rows] for m in METRIC_FIELDS}
+    deltas = {m: values[m] - base_values[m] for m in METRIC_FIELDS}
+    changed = np.logical_or.reduce([deltas[m] != 0 for m in METRIC_FIELDS]) if len(rows) else np.zeros(0, bool)
+
+    # Largest absolute change of the sort metric first
+    order = np.argsort(-np.abs(deltas[sort_metric]), kind='stable')[:limit]
+    top_changes = [
+        {
+            'equipment_id': columns['equipment_id'][row],
+            'name': columns['name'][row],
+            'type': columns['type'][row],
+            **{m: _delta(base_values[m][i], values[m][i]) for m in METRIC_FIELDS},
+        }
+        for row, i in zip(rows[order], order)
+    ]
+    n_matched = int(matched.sum())
+    return {
+        'matched': n_matched,
+        'changed': int(changed.sum()),
+        'added': len(ids) - n_matched,
+        'removed': len(base_ids) - n_matched,
+        'top_changes': top_changes,
+    }
+
+def compare_uploads(uploads, sort_metric='pressure', limit=10):
+    """
+    Compares every upload in `uploads` against the first one: per-metric
+    deltas of the stored aggregates, per-type count and mean deltas, and the
+    equipment_id-matched row changes. Each dataset is read once, however
+    many of the uploads share it (duplicates). With every snapshot in place
+    this costs no queries beyond loading `uploads`.
+    """
+    loaded = {}
+    for upload in uploads:
+        if upload.dataset_id not in loaded:
+            loaded[upload.dataset_id] = _dataset_columns(upload)
+    types = {dataset_id: _type_table(columns) for dataset_id, columns in loaded.items()}
+
+    base = uploads[0]
+    base_stats = get_upload_aggregate(base).metric_stats
+    comparisons = []
+    for upload in uploads[1:]:
+        comparisons.append({
+            'upload': upload.id,
+            'total_records': _delta(base.total_records, upload.total_records, int),
+            'metrics': _metric_deltas(base_stats, get_upload_aggregate(upload).metric_stats),
+            'types': _type_deltas(types[base.dataset_id], types[upload.dataset_id]),
+            'equipment': _equipment_deltas(loaded[base.dataset_id], loaded[upload.dataset_id], sort_metric, limit),
+        })
+    return {'base': base.id, 'comparisons': comparisons}
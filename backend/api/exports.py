@@ -0,0 +1,55 @@
+from io import BytesIO
+
+from .services import EQUIPMENT_FIELDS, iter_equipment_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar export is optional
+    pa = pq = None
+
+EXPORT_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+def export_schema():
+    return pa.schema([
+        ('equipment_id', pa.string()),
+        ('name', pa.string()),
+        ('type', pa.string()),
+        ('flowrate', pa.float64()),
+        ('pressure', pa.float64()),
+        ('temperature', pa.float64()),
+    ])
+
+def _record_batches(upload_id, schema):
+    for columns in iter_equipment_columns(upload_id, EQUIPMENT_FIELDS):
+        yield pa.record_batch([pa.array(columns[f], type=schema.field(f).type) for f in EQUIPMENT_FIELDS],
+                              schema=schema)
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+def stream_export(upload_id, file_format):
+    """
+    Yields the upload's equipment columns encoded as an Arrow IPC stream or a
+    Parquet file, one record batch (row group) at a time.
+    """
+    schema = export_schema()
+    sink = BytesIO()
+    if file_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    for batch in _record_batches(upload_id, schema):
+        write(batch)
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
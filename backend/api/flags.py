@@ -0,0 +1,51 @@
+# Critical-condition flags stored in Equipment.flags, one bit per metric and
+# kind. Nothing here imports Django, like parsing and stats.
+import numpy as np
+
+from .stats import METRIC_FIELDS
+
+# Breached an absolute operating limit (settings.CRITICAL_LIMITS)
+LIMIT_FLAGS = {m: 1 << i for i, m in enumerate(METRIC_FIELDS)}
+# More than settings.CRITICAL_ZSCORE standard deviations from the upload's mean.
+# These sit above the limit bits, so any row with an outlier bit has flags >= OUTLIER_MIN.
+OUTLIER_FLAGS = {m: 1 << (i + len(METRIC_FIELDS)) for i, m in enumerate(METRIC_FIELDS)}
+LIMIT_MASK = sum(LIMIT_FLAGS.values())
+OUTLIER_MIN = min(OUTLIER_FLAGS.values())
+
+def metric_mask(metric):
+    """Both bits of one metric."""
+    return LIMIT_FLAGS[metric] | OUTLIER_FLAGS[metric]
+
+def limit_flags(columns, limits):
+    """
+    Limit bits of a batch of normalized columns in one vectorized pass.
+    `limits` maps a metric to (low, high); None leaves that side open.
+    """
+    flags = np.zeros(len(columns['equipment_id']), dtype=np.int64)
+    for metric, (low, high) in limits.items():
+        values = columns[metric]
+        if low is not None:
+            flags[values < low] |= LIMIT_FLAGS[metric]
+        if high is not None:
+            flags[values > high] |= LIMIT_FLAGS[metric]
+    return flags
+
+def outlier_bounds(means, stds, zscore):
+    """
+    Per-metric (low, high) outside which a value's z-score exceeds `zscore`,
+    or None where the spread is undefined (fewer than two rows) or zero.
+    """
+    bounds = {}
+    for metric in METRIC_FIELDS:
+        mean, std = means.get(metric), stds.get(metric)
+        if mean is None or std is None or not std > 0:
+            bounds[metric] = None
+        else:
+            bounds[metric] = (mean - zscore * std, mean + zscore * std)
+    return bounds
+
+def flag_names(flags):
+    """['pressure_limit', 'pressure_outlier', ...] for a flags value."""
+    names = [f'{m}_limit' for m, bit in LIMIT_FLAGS.items() if flags & bit]
+    names += [f'{m}_outlier' for m, bit in OUTLIER_FLAGS.items() if flags & bit]
+    return names
@@ -0,0 +1,324 @@
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import IngestionJob, UploadHistory
+from .parsing import parse_csv_file
+from .services import (append_csv_file, create_duplicate, find_dataset, process_csv_file,
+                       prune_expired_uploads, store_parsed_csv)
+from .snapshots import evict_snapshots, write_snapshot
+from .upload_handlers import SpooledUploadedFile
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Returns the process-wide worker pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.INGEST_WORKERS,
+                thread_name_prefix='ingest',
+            )
+        return _executor
+
+def get_process_pool():
+    """
+    Returns the process pool that parses batch uploads, creating it on first
+    use. Workers are spawned rather than forked (this runs in a threaded
+    server) and only import api.parsing, which needs no Django setup.
+    """
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.INGEST_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _process_pool
+
+def discard_process_pool(pool):
+    """
+    Drops a broken process pool (a worker died, e.g. killed for memory) so
+    the next get_process_pool() starts a fresh one. Another thread may
+    already have replaced it; the new pool is left alone then.
+    """
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _submit_parse(path):
+    """Submits a spooled file to the process pool; returns (pool, future)."""
+    pool = get_process_pool()
+    try:
+        return pool, pool.submit(parse_csv_file, path, settings.INGEST_BATCH_SIZE, settings.AGGREGATE_SAMPLE_SIZE)
+    except BrokenProcessPool:
+        discard_process_pool(pool)
+        pool = get_process_pool()
+        return pool, pool.submit(parse_csv_file, path, settings.INGEST_BATCH_SIZE, settings.AGGREGATE_SAMPLE_SIZE)
+
+def recover_interrupted_jobs():
+    """
+    Fails the jobs that stopped server processes left queued or running
+    (their worker threads died with them), removes their spool files and
+    any uploads that were still streaming in, and returns the number of
+    jobs failed. Only safe while no server process is running; see the
+    recover_ingestion_jobs command.
+    """
+    stale = IngestionJob.objects.filter(status__in=[IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING])
+    job_ids = list(stale.values_list('id', flat=True))
+    failed = IngestionJob.objects.filter(id__in=job_ids).update(
+        status=IngestionJob.STATUS_FAILED, error="Interrupted by a server restart", finished_at=timezone.now())
+
+    paths = [os.path.join(settings.INGEST_SPOOL_DIR, f"{job_id}.csv") for job_id in job_ids]
+    paths += glob.glob(os.path.join(settings.INGEST_SPOOL_DIR, '*.upload'))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return failed
+
+def progress_cache_key(job_id):
+    return f"ingest-job:{job_id}:progress"
+
+def get_live_progress(job_id):
+    """Returns (processed_rows, total_rows) reported by a running job, if any."""
+    return cache.get(progress_cache_key(job_id))
+
+def _spool_upload(file_obj, job_id):
+    """
+    Moves the uploaded file into the spool directory so it outlives the
+    request and returns (path, sha256 hex digest). Files streamed there by
+    SpoolingUploadHandler are just renamed; anything else is copied chunk by
+    chunk.
+    """
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.INGEST_SPOOL_DIR, f"{job_id}.csv")
+    if isinstance(file_obj, SpooledUploadedFile):
+        os.replace(file_obj.claim(), path)
+        return path, file_obj.content_hash
+
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as dest:
+        for chunk in file_obj.chunks():
+            dest.write(chunk)
+            hasher.update(chunk)
+    return path, hasher.hexdigest()
+
+def submit_ingestion(file_obj, user, append_to=None):
+    """
+    Queues an uploaded CSV for background ingestion and returns its job.
+    With `append_to` (an UploadHistory) the rows are added to that upload
+    instead of creating a new one.
+    """
+    job = IngestionJob.objects.create(user=user, file_name=file_obj.name, upload=append_to)
+    path, content_hash = _spool_upload(file_obj, job.id)
+    append_id = append_to.id if append_to else None
+    transaction.on_commit(lambda: get_executor().submit(run_ingestion, job.id, path, content_hash, append_id))
+    return job
+
+def run_ingestion(job_id, path, content_hash=None, append_to=None):
+    """Worker entry point: parses the spooled CSV and records the outcome on the job."""
+    close_old_connections()
+    try:
+        job = IngestionJob.objects.select_related('user').get(pk=job_id)
+        job.status = IngestionJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        def report(processed, total):
+            cache.set(progress_cache_key(job_id), (processed, total), timeout=3600)
+
+        try:
+            with open(path, 'rb') as f:
+                if append_to:
+                    history, rows = append_csv_file(f, append_to, progress=report)
+                else:
+                    history = process_csv_file(f, job.user, file_name=job.file_name,
+                                               progress=report, content_hash=content_hash)
+                    rows = history.total_records
+        except ValueError as e:
+            job.status = IngestionJob.STATUS_FAILED
+            job.error = str(e)
+            job.total_rows = (get_live_progress(job_id) or (0, None))[1]
+        except Exception:
+            logger.exception("Ingestion job %s crashed", job_id)
+            job.status = IngestionJob.STATUS_FAILED
+            job.error = "Internal Server Error"
+        else:
+            job.status = IngestionJob.STATUS_COMPLETED
+            job.upload = history
+            job.total_rows = job.processed_rows = rows
+
+        job.finished_at = timezone.now()
+        job.save()
+
+        if job.status == IngestionJob.STATUS_COMPLETED:
+            if not history.source_id:
+                schedule_snapshot(history.id)
+            if not append_to:
+                schedule_prune(job.user_id)
+    finally:
+        cache.delete(progress_cache_key(job_id))
+        if os.path.exists(path):
+            os.remove(path)
+        close_old_connections()
+
+def submit_batch_ingestion(files, user):
+    """
+    Queues several uploaded CSVs for ingestion as one batch and returns
+    (batch id, jobs in upload order). Each file gets its own job, so results
+    are reported per file.
+    """
+    batch_id = uuid.uuid4()
+    jobs = IngestionJob.objects.bulk_create(
+        [IngestionJob(user=user, file_name=f.name, batch_id=batch_id) for f in files])
+    items = [(job.id, *_spool_upload(f, job.id)) for job, f in zip(jobs, files)]
+    transaction.on_commit(lambda: get_executor().submit(run_batch_ingestion, user.id, items))
+    return batch_id, jobs
+
+def _store_batch_file(user, file_name, path, content_hash, parsed):
+    """
+    Commits one file of a batch; `parsed` is its (pool, future), or None if
+    it wasn't parsed. If the pool broke, the file is parsed once more in a
+    fresh pool before it is given up on.
+    """
+    # Identical to an earlier upload, including one earlier in this batch
+    source = find_dataset(user, content_hash)
+    if source:
+        return create_duplicate(user, file_name, content_hash, source)
+    if parsed is None:
+        # Its original was pruned since the batch started: parse it here
+        with open(path, 'rb') as f:
+            return process_csv_file(f, user, file_name=file_name, content_hash=content_hash)
+    pool, future = parsed
+    try:
+        try:
+            batches, stats = future.result()
+        except BrokenProcessPool:
+            discard_process_pool(pool)
+            _, future = _submit_parse(path)
+            batches, stats = future.result()
+    except Exception as e:
+        raise ValueError(f"Error processing CSV: {str(e)}")
+    return store_parsed_csv(user, file_name, content_hash, batches, stats)
+
+def run_batch_ingestion(user_id, items):
+    """
+    Worker entry point for a batch of (job id, spooled path, content hash).
+
+    Files are parsed in parallel by the process pool, each distinct content
+    once, while this thread commits them one at a time in upload order.
+    uploaded_at, deduplication and retention therefore come out exactly as
+    if the files had been uploaded one after another; retention pruning runs
+    once at the end. At most INGEST_PROCESSES * 2 parsed files wait in
+    memory for their turn.
+    """
+    close_old_connections()
+    try:
+        user = User.objects.get(pk=user_id)
+        jobs = IngestionJob.objects.in_bulk([job_id for job_id, _, _ in items])
+        IngestionJob.objects.filter(id__in=jobs).update(
+            status=IngestionJob.STATUS_RUNNING, started_at=timezone.now())
+
+        # Contents the user already has are recorded as duplicates, not parsed
+        hashes = {content_hash for _, _, content_hash in items}
+        seen = set(UploadHistory.objects.filter(user=user, source__isnull=True, content_hash__in=hashes)
+                   .values_list('content_hash', flat=True))
+        futures = {}
+        ahead = iter(items)
+
+        def parse_next():
+            for _, path, content_hash in ahead:
+                if content_hash not in seen:
+                    seen.add(content_hash)
+                    futures[content_hash] = _submit_parse(path)
+                    return
+
+        for _ in range(settings.INGEST_PROCESSES * 2):
+            parse_next()
+
+        completed = False
+        for job_id, path, content_hash in items:
+            job = jobs[job_id]
+            try:
+                history = _store_batch_file(user, job.file_name, path, content_hash, futures.pop(content_hash, None))
+            except ValueError as e:
+                job.status = IngestionJob.STATUS_FAILED
+                job.error = str(e)
+            except Exception:
+                logger.exception("Batch ingestion job %s crashed", job_id)
+                job.status = IngestionJob.STATUS_FAILED
+                job.error = "Internal Server Error"
+            else:
+                job.status = IngestionJob.STATUS_COMPLETED
+                job.upload = history
+                job.total_rows = job.processed_rows = history.total_records
+                completed = True
+                if not history.source_id:
+                    schedule_snapshot(history.id)
+            job.finished_at = timezone.now()
+            job.save()
+            parse_next()
+
+        if completed:
+            schedule_prune(user_id)
+    except Exception:
+        logger.exception("Batch ingestion of user %s crashed", user_id)
+        IngestionJob.objects.filter(id__in=[job_id for job_id, _, _ in items],
+                                    status__in=[IngestionJob.STATUS_QUEUED, IngestionJob.STATUS_RUNNING]).update(
+            status=IngestionJob.STATUS_FAILED, error="Internal Server Error", finished_at=timezone.now())
+    finally:
+        for _, path, _ in items:
+            if os.path.exists(path):
+                os.remove(path)
+        close_old_connections()
+
+def schedule_prune(user_id):
+    """Queues retention pruning for a user on the worker pool."""
+    get_executor().submit(run_prune, user_id)
+
+def schedule_snapshot(upload_id):
+    """Queues writing the columnar snapshot of a freshly stored dataset."""
+    get_executor().submit(run_snapshot, upload_id)
+
+def run_snapshot(upload_id):
+    close_old_connections()
+    try:
+        history = UploadHistory.objects.filter(pk=upload_id).first()
+        # Pruned, or handed its rows to a duplicate, before its turn came
+        if history and not history.source_id:
+            write_snapshot(history)
+    except Exception:
+        logger.exception("Snapshotting upload %s failed", upload_id)
+    finally:
+        close_old_connections()
+
+def run_prune(user_id):
+    close_old_connections()
+    try:
+        removed = prune_expired_uploads(user_id)
+        if removed:
+            evict_snapshots(removed)
+            logger.info("Pruned %d expired uploads of user %s", len(removed), user_id)
+    except Exception:
+        logger.exception("Pruning uploads of user %s failed", user_id)
+    finally:
+        close_old_connections()
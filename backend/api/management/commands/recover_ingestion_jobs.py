@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import recover_interrupted_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Fails ingestion jobs left queued or running by a stopped server and removes their "
+        "spool files. Run it while no server process is running, e.g. in the deploy step "
+        "before the server starts: a running server's live jobs would be failed too."
+    )
+
+    def handle(self, *args, **options):
+        failed = recover_interrupted_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Failed {failed} interrupted ingestion job(s)"))
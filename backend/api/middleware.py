@@ -0,0 +1,85 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.middleware.gzip import GZipMiddleware
+
+logger = logging.getLogger('api.queries')
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryStats:
+    """execute_wrapper that counts and times every statement of a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total_time += elapsed
+            self.statements.append((elapsed, sql))
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda s: s[0], reverse=True)[:n]
+
+class QueryStatsMiddleware:
+    """
+    Records per-request query count, total SQL time and the slowest
+    statements, and checks them against the per-endpoint QUERY_BUDGETS
+    (keyed by URL name). Over-budget requests are logged, or raise
+    QueryBudgetExceeded when QUERY_BUDGET_STRICT is on (e.g. in CI).
+    Statements issued while a StreamingHttpResponse is consumed happen
+    after this middleware returns and are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+
+        total_ms = stats.total_time * 1000
+        if settings.QUERY_STATS_HEADERS:
+            response['X-DB-Query-Count'] = str(stats.count)
+            response['X-DB-Query-Time-Ms'] = f"{total_ms:.2f}"
+
+        for elapsed, sql in stats.slowest(settings.QUERY_STATS_SLOWEST):
+            if elapsed * 1000 >= settings.QUERY_STATS_SLOW_MS:
+                logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, request.path, sql)
+
+        match = request.resolver_match
+        budget = settings.QUERY_BUDGETS.get(match.url_name) if match else None
+        logger.debug("%s %s: %d queries in %.2f ms", request.method, request.path, stats.count, total_ms)
+        if budget is not None and stats.count > budget:
+            message = f"{request.method} {request.path} ({match.url_name}) ran {stats.count} queries, budget is {budget}"
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware restricted to JSON responses of at least GZIP_MIN_BYTES.
+    PDFs and Arrow/Parquet exports are already compact, and compressing
+    them would only cost CPU. Strong ETags become weak (W/"..."), which
+    If-None-Match still matches.
+    """
+
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith('application/json'):
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_BYTES:
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 18:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_distribution', models.JSONField(default=list)),
+                ('metric_stats', models.JSONField(default=dict)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='aggregate', to='api.uploadhistory')),
+            ],
+        ),
+    ]
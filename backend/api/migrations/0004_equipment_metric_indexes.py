@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_uploadaggregate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['upload', 'flowrate'], name='api_equipme_upload__f8ab96_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['upload', 'pressure'], name='api_equipme_upload__668465_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['upload', 'temperature'], name='api_equipme_upload__8313a8_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_uploadhistory_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadaggregate',
+            name='state',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
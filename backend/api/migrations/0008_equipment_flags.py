@@ -0,0 +1,56 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Case, Q, StdDev, Value, When
+
+from api.flags import LIMIT_FLAGS, OUTLIER_FLAGS, outlier_bounds
+from api.stats import METRIC_FIELDS
+
+
+def _outside(metric, low, high):
+    condition = Q()
+    if low is not None:
+        condition |= Q(**{f'{metric}__lt': low})
+    if high is not None:
+        condition |= Q(**{f'{metric}__gt': high})
+    return condition
+
+
+def flag_existing_rows(apps, schema_editor):
+    """Flags the rows stored before flags existed: one aggregate and one UPDATE per dataset."""
+    Equipment = apps.get_model('api', 'Equipment')
+    UploadHistory = apps.get_model('api', 'UploadHistory')
+    for upload_id in UploadHistory.objects.filter(source__isnull=True).values_list('id', flat=True):
+        rows = Equipment.objects.filter(upload_id=upload_id)
+        moments = rows.aggregate(**{f'{m}_mean': Avg(m) for m in METRIC_FIELDS},
+                                 **{f'{m}_std': StdDev(m, sample=True) for m in METRIC_FIELDS})
+        bounds = outlier_bounds({m: moments[f'{m}_mean'] for m in METRIC_FIELDS},
+                                {m: moments[f'{m}_std'] for m in METRIC_FIELDS}, settings.CRITICAL_ZSCORE)
+        conditions = [(LIMIT_FLAGS[m], _outside(m, *limits)) for m, limits in settings.CRITICAL_LIMITS.items()]
+        conditions += [(OUTLIER_FLAGS[m], _outside(m, *bound)) for m, bound in bounds.items() if bound]
+        flags = Value(0)
+        for bit, condition in conditions:
+            if condition:
+                flags = flags + Case(When(condition, then=Value(bit)), default=Value(0))
+        rows.update(flags=flags)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_ingestionjob_batch_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='flags',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['upload', 'flags'], name='api_equipme_upload__a18ff8_idx'),
+        ),
+        migrations.RunPython(flag_existing_rows, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,23 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User 
 
+class UploadHistoryQuerySet(models.QuerySet):
+    def with_aggregates(self):
+        """
+        Joins each upload's aggregate and its source's (for duplicates), minus
+        the serialized RunningStats, which only appends need.
+        """
+        return (self.select_related('aggregate', 'source__aggregate')
+                .defer('aggregate__state', 'source__aggregate__state'))
+
 class UploadHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads') 
     file_name = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Bumped when rows are appended; part of the dashboard/history ETag
+    updated_at = models.DateTimeField(auto_now=True)
     
     # Stats
     total_records = models.IntegerField(default=0)
@@ -12,9 +25,21 @@ class UploadHistory(models.Model):
     avg_pressure = models.FloatField(null=True, blank=True)
     avg_temperature = models.FloatField(null=True, blank=True)
 
+    # SHA-256 of the uploaded bytes; a repeat upload of the same file points
+    # at the original via `source` instead of storing its rows again
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    source = models.ForeignKey('self', on_delete=models.RESTRICT, null=True, blank=True, related_name='duplicates')
+
+    objects = UploadHistoryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.file_name}"
 
+    @property
+    def dataset_id(self):
+        """Id of the upload whose Equipment rows and aggregate hold this upload's data."""
+        return self.source_id or self.id
+
 class Equipment(models.Model):
     upload = models.ForeignKey(UploadHistory, on_delete=models.CASCADE, related_name='equipments')
     equipment_id = models.CharField(max_length=50)
@@ -23,6 +48,63 @@ class Equipment(models.Model):
     flowrate = models.FloatField()
     pressure = models.FloatField()
     temperature = models.FloatField()
+    # Critical-condition bits set at ingest (see api.flags); 0 for a normal row
+    flags = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        # Keyset pagination and top-N lookups sort within a single upload
+        indexes = [
+            models.Index(fields=['upload', 'flowrate']),
+            models.Index(fields=['upload', 'pressure']),
+            models.Index(fields=['upload', 'temperature']),
+            # Critical rows are found without reading the normal ones
+            models.Index(fields=['upload', 'flags']),
+        ]
     
     def __str__(self):
-        return f"{self.name} ({self.type})"
\ No newline at end of file
+        return f"{self.name} ({self.type})"
+
+class UploadAggregate(models.Model):
+    """Summary statistics computed once at ingest time for an upload."""
+    upload = models.OneToOneField(UploadHistory, on_delete=models.CASCADE, related_name='aggregate')
+
+    # [{'type': 'Pump', 'count': 12}, ...] sorted by type
+    type_distribution = models.JSONField(default=list)
+    # {'pressure': {'min': .., 'max': .., 'mean': .., 'std': .., 'p50': .., ...}, ...}
+    metric_stats = models.JSONField(default=dict)
+    # Serialized stats.RunningStats, so appends merge into it without rescanning
+    state = models.BinaryField(null=True, editable=False)
+
+    def __str__(self):
+        return f"Aggregates for {self.upload}"
+
+class IngestionJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # Progress
+    total_rows = models.IntegerField(null=True, blank=True)
+    processed_rows = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    upload = models.ForeignKey(UploadHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Shared by the jobs of one batch upload (see jobs.submit_batch_ingestion)
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.file_name} ({self.status})"
@@ -0,0 +1,33 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+class EquipmentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over an upload's equipment rows. Clients may pick the
+    sort key with `?ordering=` (prefix with '-' for descending); ties are
+    broken by primary key so page boundaries stay stable.
+    """
+    page_size = 500
+    page_size_query_param = 'limit'
+    max_page_size = 5000
+    ordering = ('id',)
+    ordering_fields = ('id', 'equipment_id', 'name', 'type', 'flowrate', 'pressure', 'temperature')
+    # Column names of the rows when paginating plain values_list() tuples
+    row_fields = None
+
+    def get_ordering(self, request, queryset, view):
+        param = request.query_params.get('ordering')
+        if not param:
+            return self.ordering
+        field = param.lstrip('-')
+        if field not in self.ordering_fields:
+            raise ValidationError({'ordering': f"Must be one of: {', '.join(self.ordering_fields)}"})
+        if field == 'id':
+            return (param,)
+        tiebreak = '-id' if param.startswith('-') else 'id'
+        return (param, tiebreak)
+
+    def _get_position_from_instance(self, instance, ordering):
+        if self.row_fields is not None and isinstance(instance, tuple):
+            return str(instance[self.row_fields.index(ordering[0].lstrip('-'))])
+        return super()._get_position_from_instance(instance, ordering)
@@ -0,0 +1,56 @@
+# CSV parsing shared by in-process ingestion and the batch process pool.
+# Nothing here imports Django, so pool workers load it without setting Django up.
+import numpy as np
+import pandas as pd
+
+from .stats import RunningStats
+
+def normalize_frame(df):
+    """Fills defaults and coerces types column-wise to match the Equipment model."""
+    n = len(df)
+    default_ids = pd.Series('EQ-' + df.index.astype(str), index=df.index)
+
+    def text_column(name, default):
+        if name not in df:
+            col = pd.Series(default, index=df.index, dtype=object)
+        else:
+            col = df[name].where(df[name].notna(), default)
+        return col.astype(str).to_numpy(dtype=object)
+
+    def numeric_column(name):
+        if name not in df:
+            return np.zeros(n, dtype=np.float64)
+        return pd.to_numeric(df[name]).fillna(0.0).to_numpy(dtype=np.float64)
+
+    return {
+        'equipment_id': text_column('equipment_id', default_ids),
+        'name': text_column('equipment_name', 'Unknown'),
+        'type': text_column('type', 'Generic'),
+        'flowrate': numeric_column('flowrate'),
+        'pressure': numeric_column('pressure'),
+        'temperature': numeric_column('temperature'),
+    }
+
+def read_csv_batches(file_obj, batch_size, index_offset=0):
+    """
+    Yields normalized column dicts of a CSV, `batch_size` rows at a time.
+    Default equipment ids continue from `index_offset`.
+    """
+    for df in pd.read_csv(file_obj, chunksize=batch_size):
+        df.columns = [c.strip().lower().replace(' ', '_') for c in df.columns]
+        df.index += index_offset
+        yield normalize_frame(df)
+
+def parse_csv_file(path, batch_size, sample_size):
+    """
+    Process-pool entry point: parses and normalizes a whole spooled CSV and
+    returns (column batches, RunningStats), ready to be inserted by the
+    parent without further per-row work.
+    """
+    stats = RunningStats(sample_size)
+    batches = []
+    with open(path, 'rb') as f:
+        for columns in read_csv_batches(f, batch_size):
+            stats.update(columns)
+            batches.append(columns)
+    return batches, stats
@@ -0,0 +1,75 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+_BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 2 ** 10
+
+def parse_byte_range(header, size):
+    """
+    Returns the inclusive (start, end) of a single `bytes=` Range header
+    against a file of `size` bytes, or None when the whole file should be
+    sent (no header, multiple ranges or a syntax we don't serve). Raises
+    ValueError when the range cannot be satisfied.
+    """
+    match = _BYTE_RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            raise ValueError(header)
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+def _read_range(f, start, length):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def ranged_file_response(request, f, etag, filename, content_type):
+    """
+    Serves an open binary file with single-range support (206 Partial
+    Content), so an interrupted download can resume where it stopped. A
+    Range sent with an If-Range that no longer matches `etag` gets the whole
+    file instead. `etag` must describe the bytes of `f` itself; the file is
+    closed once the response has been sent.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_byte_range(request.headers.get('Range'), size)
+        except ValueError:
+            f.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(f, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UploadHistory, Equipment
+from .models import UploadHistory, Equipment, IngestionJob
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,4 +21,67 @@ class UploadHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = UploadHistory
         fields = ['id', 'file_name', 'uploaded_at', 'total_records', 
-                  'avg_flowrate', 'avg_pressure', 'avg_temperature']
\ No newline at end of file
+                  'avg_flowrate', 'avg_pressure', 'avg_temperature']
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    upload = UploadHistorySerializer(read_only=True)
+    progress = serializers.SerializerMethodField()
+    rows_per_sec = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = ['id', 'file_name', 'status', 'created_at', 'started_at', 'finished_at',
+                  'total_rows', 'processed_rows', 'progress', 'rows_per_sec', 'error', 'upload']
+
+    def get_progress(self, obj):
+        if obj.status == IngestionJob.STATUS_COMPLETED:
+            return 1.0
+        if not obj.total_rows:
+            return 0.0
+        return round(obj.processed_rows / obj.total_rows, 4)
+
+    def get_rows_per_sec(self, obj):
+        if obj.status != IngestionJob.STATUS_COMPLETED or not obj.started_at:
+            return None
+        elapsed = (obj.finished_at - obj.started_at).total_seconds()
+        return round(obj.processed_rows / elapsed, 1) if elapsed else None
+
+
+class RowSerializer:
+    """
+    Read-only fast path for list endpoints. Turns `values_list()` rows into
+    dicts directly, skipping model instantiation and per-field serializer
+    calls, while producing the same output as the matching ModelSerializer.
+    """
+    fields = ()
+    # Field name -> callable applied to non-null values (e.g. datetime formatting)
+    converters = {}
+
+    def __init__(self, fields=None):
+        self.fields = tuple(fields or self.fields)
+
+    def values_list(self, queryset, *extra):
+        return queryset.values_list(*self.fields, *extra)
+
+    def to_representation(self, rows):
+        keys = self.fields
+        converters = [(f, self.converters[f]) for f in keys if f in self.converters]
+        if not converters:
+            # zip() stops at the declared fields, so extra trailing values are dropped
+            return [dict(zip(keys, row)) for row in rows]
+
+        data = []
+        for row in rows:
+            item = dict(zip(keys, row))
+            for field, convert in converters:
+                if item[field] is not None:
+                    item[field] = convert(item[field])
+            data.append(item)
+        return data
+
+class EquipmentRowSerializer(RowSerializer):
+    fields = EquipmentSerializer.Meta.fields
+
+class UploadHistoryRowSerializer(RowSerializer):
+    fields = UploadHistorySerializer.Meta.fields
+    converters = {'uploaded_at': serializers.DateTimeField().to_representation}
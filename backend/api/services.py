@@ -1,71 +1,418 @@
+import glob
+import hashlib
+import os
+import tempfile
+import numpy as np
 import pandas as pd
-from .models import UploadHistory, Equipment
+from functools import partial, reduce
+from itertools import repeat
+from operator import or_
+from .caching import invalidate_user_cache
+from .flags import LIMIT_MASK, OUTLIER_FLAGS, limit_flags, outlier_bounds
+from .models import UploadHistory, Equipment, UploadAggregate
+from .parsing import read_csv_batches
+from .stats import METRIC_FIELDS, RunningStats
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
-from django.db import transaction
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
 from io import BytesIO
 
-def process_csv_file(file_obj, user): 
+EQUIPMENT_FIELDS = ('equipment_id', 'name', 'type', 'flowrate', 'pressure', 'temperature')
+# Bump whenever generate_pdf_report changes its layout so cached reports are re-rendered
+REPORT_VERSION = 2
+
+def get_upload_aggregate(history):
     """
-    Parses CSV, assigns to USER, calculates stats, and enforces per-user 5-dataset limit.
+    Returns the stored aggregates for an upload, building them from its
+    equipment rows for uploads ingested before aggregates existed.
+    Duplicate uploads share the aggregate of their source.
     """
+    if history.source_id:
+        history = history.source
     try:
-        df = pd.read_csv(file_obj)
-        df.columns = [c.strip().lower().replace(' ', '_') for c in df.columns]
-        
-        stats = {
-            'total_records': len(df),
-            'avg_flowrate': df['flowrate'].mean() if 'flowrate' in df else 0,
-            'avg_pressure': df['pressure'].mean() if 'pressure' in df else 0,
-            'avg_temperature': df['temperature'].mean() if 'temperature' in df else 0,
-        }
-        
+        return history.aggregate
+    except UploadAggregate.DoesNotExist:
+        pass
+
+    stats = _scan_running_stats(history.id)
+    aggregate, _ = UploadAggregate.objects.get_or_create(upload=history, defaults=stats.to_aggregate())
+    return aggregate
+
+def _scan_running_stats(upload_id):
+    stats = RunningStats(settings.AGGREGATE_SAMPLE_SIZE)
+    for columns in iter_equipment_columns(upload_id, ('type', *METRIC_FIELDS)):
+        stats.update(columns)
+    return stats
+
+def load_running_stats(aggregate):
+    """
+    Returns the mergeable summary behind an aggregate. Aggregates stored
+    before the summary was persisted are rebuilt from their rows once.
+    """
+    if aggregate.state is not None:
+        return RunningStats.loads(aggregate.state, settings.AGGREGATE_SAMPLE_SIZE)
+    return _scan_running_stats(aggregate.upload_id)
+
+def iter_equipment_columns(upload_id, fields=EQUIPMENT_FIELDS, batch_size=None):
+    """
+    Yields an upload's equipment rows as dicts of column lists, `batch_size`
+    rows at a time, straight from the DB cursor without building model
+    instances.
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    queryset = Equipment.objects.filter(upload_id=upload_id).order_by('id').values_list(*fields)
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield dict(zip(fields, (list(col) for col in zip(*rows))))
+
+def load_equipment_frame(upload_id, fields=EQUIPMENT_FIELDS):
+    """Loads an upload's equipment columns into a DataFrame."""
+    batches = [pd.DataFrame(batch, columns=fields) for batch in iter_equipment_columns(upload_id, fields)]
+    if not batches:
+        return pd.DataFrame({f: pd.Series(dtype=np.float64 if f in METRIC_FIELDS else object) for f in fields})
+    return pd.concat(batches, ignore_index=True)
+
+def _bulk_insert_equipment(upload_id, columns, batch_size):
+    """
+    Writes normalized columns straight to the Equipment table in large
+    batches, with their limit flags computed in one vectorized pass.
+    """
+    opts = Equipment._meta
+    qn = connection.ops.quote_name
+    db_columns = ([opts.get_field('upload').column] + [opts.get_field(f).column for f in EQUIPMENT_FIELDS]
+                  + [opts.get_field('flags').column])
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        qn(opts.db_table),
+        ', '.join(qn(c) for c in db_columns),
+        ', '.join(['%s'] * len(db_columns)),
+    )
+
+    total = len(columns['equipment_id'])
+    flags = limit_flags(columns, settings.CRITICAL_LIMITS)
+    with connection.cursor() as cursor:
+        for start in range(0, total, batch_size):
+            batch = [columns[f][start:start + batch_size].tolist() for f in EQUIPMENT_FIELDS]
+            cursor.executemany(sql, zip(repeat(upload_id), *batch, flags[start:start + batch_size].tolist()))
+
+def _outside(metric, bound):
+    return [Q(**{f'{metric}__lt': bound[0]}), Q(**{f'{metric}__gt': bound[1]})]
+
+def _flag_outliers(upload_id, stats, previous=None, first_new_id=None):
+    """
+    Sets the z-score outlier bits of an upload's rows from its final mean and
+    standard deviation (`stats`) in one UPDATE and returns the rows written;
+    the limit bits set at insert are kept. Without `previous` the rows are
+    all new and unflagged, so only the outliers are written.
+
+    After an append, `previous` holds the bounds (flags.outlier_bounds) the
+    existing rows were flagged with and `first_new_id` the id of the first
+    appended row. An existing row is only rewritten if one of its values
+    lies between an old and a new bound, an appended row only if it is an
+    outlier. Every OR term is a range on one (upload, metric) index, so
+    SQLite reads those rows instead of scanning the whole upload.
+    """
+    bounds = outlier_bounds(stats.means(), stats.stds(), settings.CRITICAL_ZSCORE)
+    terms = []
+    for metric, bound in bounds.items():
+        old = previous.get(metric) if previous is not None else None
+        if bound is not None:
+            appended = Q(id__gte=first_new_id) if previous is not None else Q()
+            terms += [appended & term for term in _outside(metric, bound)]
+        if old is not None and bound is not None:
+            terms += [Q(**{f'{metric}__range': sorted((old[0], bound[0]))}),
+                      Q(**{f'{metric}__range': sorted((old[1], bound[1]))})]
+        elif old is not None:
+            # No spread any more: clear the bits of the old outliers
+            terms += _outside(metric, old)
+        elif bound is not None and previous is not None:
+            # The spread only now exists: any existing row may be an outlier
+            terms += _outside(metric, bound)
+    if not terms:
+        return 0
+
+    flags = F('flags').bitand(LIMIT_MASK)
+    for metric, bound in bounds.items():
+        if bound is not None:
+            flags = flags + Case(When(reduce(or_, _outside(metric, bound)), then=Value(OUTLIER_FLAGS[metric])),
+                                 default=Value(0))
+    # upload_id inside every term, so each one can be served by its own index
+    candidates = reduce(or_, (Q(upload_id=upload_id) & term for term in terms))
+    return Equipment.objects.filter(candidates).update(flags=flags)
+
+def _scan_file(file_obj):
+    """
+    One cheap pass over the raw bytes: returns (data line count, SHA-256 hex
+    digest). The line count is only a row estimate for progress reporting.
+    """
+    hasher = hashlib.sha256()
+    lines = 0
+    for chunk in iter(partial(file_obj.read, 2**20), b''):
+        hasher.update(chunk)
+        lines += chunk.count(b'\n')
+    file_obj.seek(0)
+    return max(lines - 1, 0), hasher.hexdigest()
+
+def find_dataset(user, content_hash):
+    """Returns the user's upload that holds the rows of a file with this hash, if any."""
+    return UploadHistory.objects.filter(user=user, content_hash=content_hash, source__isnull=True).first()
+
+def _ingest_rows(upload_id, file_obj, stats, total, progress=None, index_offset=0):
+    """
+    Reads a CSV INGEST_BATCH_SIZE rows at a time; each batch is normalized,
+    inserted and folded into `stats` before the next is parsed. Default
+    equipment ids continue from `index_offset`. Returns the number of rows.
+    """
+    batch_size = settings.INGEST_BATCH_SIZE
+    rows = 0
+    for columns in read_csv_batches(file_obj, batch_size, index_offset):
+        _bulk_insert_equipment(upload_id, columns, batch_size)
+        stats.update(columns)
+        rows += len(columns['equipment_id'])
+        if progress:
+            progress(rows, max(total, rows))
+    return rows
+
+def _apply_stats(history, stats):
+    """Copies the summary fields of `stats` onto an UploadHistory (unsaved)."""
+    means = stats.means()
+    history.total_records = stats.count
+    history.avg_flowrate = means['flowrate']
+    history.avg_pressure = means['pressure']
+    history.avg_temperature = means['temperature']
+
+def create_duplicate(user, file_name, content_hash, source):
+    """Records an upload whose rows are already stored under `source`."""
+    with transaction.atomic():
+        history = UploadHistory.objects.create(
+            user=user,
+            file_name=file_name,
+            content_hash=content_hash,
+            source=source,
+            total_records=source.total_records,
+            avg_flowrate=source.avg_flowrate,
+            avg_pressure=source.avg_pressure,
+            avg_temperature=source.avg_temperature,
+        )
+        transaction.on_commit(partial(invalidate_user_cache, user.id))
+    return history
+
+def store_parsed_csv(user, file_name, content_hash, batches, stats):
+    """
+    Commits a CSV already parsed by parsing.parse_csv_file (e.g. in a pool
+    process) as a new upload: one transaction of bulk INSERTs plus the
+    history and aggregate rows.
+    """
+    batch_size = settings.INGEST_BATCH_SIZE
+    with transaction.atomic():
+        history = UploadHistory(user=user, file_name=file_name, content_hash=content_hash)
+        _apply_stats(history, stats)
+        history.save()
+        for columns in batches:
+            _bulk_insert_equipment(history.id, columns, batch_size)
+        _flag_outliers(history.id, stats)
+        UploadAggregate.objects.create(upload=history, **stats.to_aggregate())
+        transaction.on_commit(partial(invalidate_user_cache, user.id))
+    return history
+
+def process_csv_file(file_obj, user, file_name=None, progress=None, content_hash=None): 
+    """
+    Parses CSV, assigns to USER and calculates stats. Retention is enforced
+    separately by prune_expired_uploads(), outside this transaction.
+
+    The file (opened in binary mode) is read INGEST_BATCH_SIZE rows at a
+    time; each batch is normalized, inserted (with its limit flags) and
+    folded into running aggregates before the next is parsed, so memory
+    stays flat however large the upload. Outlier flags need the final mean
+    and spread, so one UPDATE sets them once every row is in.
+    `progress(processed_rows, total_rows)` is called after every batch, with
+    total_rows estimated from a newline count.
+
+    If the user already uploaded a file with the same `content_hash` (computed
+    here when not given), the new history entry just points at that dataset
+    and nothing is parsed.
+    """
+    try:
+        total, file_hash = _scan_file(file_obj)
+        content_hash = content_hash or file_hash
+
+        source = find_dataset(user, content_hash)
+        if source:
+            history = create_duplicate(user, file_name or file_obj.name, content_hash, source)
+            if progress:
+                progress(history.total_records, history.total_records)
+            return history
+
+        if progress:
+            progress(0, total)
+
+        stats = RunningStats(settings.AGGREGATE_SAMPLE_SIZE)
         with transaction.atomic():
             history = UploadHistory.objects.create(
                 user=user, 
-                file_name=file_obj.name,
-                **stats
+                file_name=file_name or file_obj.name,
+                content_hash=content_hash,
+                total_records=0,
             )
-            
-            equipment_instances = [
-                Equipment(
-                    upload=history,
-                    equipment_id=row.get('equipment_id', f"EQ-{i}"),
-                    name=row.get('equipment_name', 'Unknown'),
-                    type=row.get('type', 'Generic'),
-                    flowrate=row.get('flowrate', 0.0),
-                    pressure=row.get('pressure', 0.0),
-                    temperature=row.get('temperature', 0.0)
-                )
-                for i, row in df.iterrows()
-            ]
-            Equipment.objects.bulk_create(equipment_instances)
-
-            user_uploads = UploadHistory.objects.filter(user=user).order_by('-uploaded_at')
-            last_5_ids = user_uploads.values_list('id', flat=True)[:5]
-            
-            UploadHistory.objects.filter(user=user).exclude(id__in=last_5_ids).delete()
+
+            _ingest_rows(history.id, file_obj, stats, total, progress)
+            _flag_outliers(history.id, stats)
+            _apply_stats(history, stats)
+            history.save(update_fields=['total_records', 'avg_flowrate', 'avg_pressure', 'avg_temperature'])
+            UploadAggregate.objects.create(upload=history, **stats.to_aggregate())
+
+            transaction.on_commit(partial(invalidate_user_cache, user.id))
             
         return history
         
     except Exception as e:
         raise ValueError(f"Error processing CSV: {str(e)}")
     
-def generate_pdf_report(history_id):
-    """Generates a PDF buffer for the given upload history."""
+def _copy_dataset(from_id, to_id):
+    """Copies one upload's Equipment rows (one INSERT ... SELECT) and aggregate to another."""
+    opts = Equipment._meta
+    qn = connection.ops.quote_name
+    upload_column = qn(opts.get_field('upload').column)
+    columns = ', '.join(qn(opts.get_field(f).column) for f in (*EQUIPMENT_FIELDS, 'flags'))
+    table = qn(opts.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({upload_column}, {columns}) "
+            f"SELECT %s, {columns} FROM {table} WHERE {upload_column} = %s ORDER BY {qn(opts.pk.column)}",
+            [to_id, from_id],
+        )
+    aggregate = get_upload_aggregate(UploadHistory.objects.get(id=from_id))
+    UploadAggregate.objects.create(
+        upload_id=to_id,
+        type_distribution=aggregate.type_distribution,
+        metric_stats=aggregate.metric_stats,
+        state=aggregate.state,
+    )
+
+def _detach_dataset(history):
+    """
+    Copy-on-write for deduplicated datasets: makes `history` the sole owner
+    of its rows before they are modified. A duplicate gets its own copy of
+    the source's rows; a source hands a copy to its oldest duplicate, which
+    becomes the new source of the others.
+    """
+    if history.source_id:
+        _copy_dataset(history.source_id, history.id)
+        history.source = None
+        return
+
+    heir = history.duplicates.order_by('uploaded_at').first()
+    if heir:
+        _copy_dataset(history.id, heir.id)
+        history.duplicates.exclude(id=heir.id).update(source=heir)
+        UploadHistory.objects.filter(id=heir.id).update(source=None)
+
+def append_csv_file(file_obj, history_id, progress=None):
+    """
+    Appends a CSV's rows to an existing upload and returns (history, rows
+    appended). Only the new rows are read: they are folded into the upload's
+    stored RunningStats, and total_records, the averages and the aggregate
+    are rewritten from the merged summary. `progress(processed_rows,
+    total_rows)` counts the appended rows.
+    """
+    try:
+        total, _ = _scan_file(file_obj)
+        if progress:
+            progress(0, total)
+
+        with transaction.atomic():
+            # Serializes concurrent appends to the same upload
+            history = UploadHistory.objects.select_for_update().get(id=history_id)
+            _detach_dataset(history)
+            aggregate = get_upload_aggregate(history)
+
+            stats = load_running_stats(aggregate)
+            previous = outlier_bounds(stats.means(), stats.stds(), settings.CRITICAL_ZSCORE)
+            last_id = (Equipment.objects.filter(upload_id=history.id).order_by('-id')
+                       .values_list('id', flat=True).first()) or 0
+            batch = RunningStats(settings.AGGREGATE_SAMPLE_SIZE)
+            rows = _ingest_rows(history.id, file_obj, batch, total, progress, index_offset=history.total_records)
+            stats.merge(batch)
+            # The mean and spread moved: only rows between the old and new bounds can change
+            _flag_outliers(history.id, stats, previous, first_new_id=last_id + 1)
+
+            _apply_stats(history, stats)
+            # The rows no longer match the uploaded file, so stop deduplicating against it
+            history.content_hash = ''
+            history.save()
+            for field, value in stats.to_aggregate().items():
+                setattr(aggregate, field, value)
+            aggregate.save()
+
+            transaction.on_commit(partial(invalidate_user_cache, history.user_id))
+            transaction.on_commit(partial(evict_report_cache, [history.id]))
+
+        return history, rows
+
+    except UploadHistory.DoesNotExist:
+        raise ValueError("The upload no longer exists")
+    except Exception as e:
+        raise ValueError(f"Error processing CSV: {str(e)}")
+
+def prune_expired_uploads(user_id, keep=None):
+    """
+    Deletes all but the user's newest `keep` uploads (UPLOAD_RETENTION by
+    default) and returns the removed ids. Equipment rows go first with one
+    set-based DELETE per upload, each in its own short transaction, so the
+    cost never lands on an upload request and writers are not blocked for
+    long.
+
+    An expired upload whose dataset is still shared by a retained duplicate
+    hands its rows and aggregate over to the oldest such duplicate instead.
+    """
+    keep = settings.UPLOAD_RETENTION if keep is None else keep
+    user_uploads = UploadHistory.objects.filter(user_id=user_id)
+    keep_ids = user_uploads.order_by('-uploaded_at').values_list('id', flat=True)[:keep]
+    expired = list(user_uploads.exclude(id__in=keep_ids).values_list('id', 'source_id'))
+    expired_ids = [upload_id for upload_id, _ in expired]
+
+    # Duplicates own no rows; drop them first so sources only keep live references
+    UploadHistory.objects.filter(id__in=[i for i, source_id in expired if source_id]).delete()
+
+    qn = connection.ops.quote_name
+    opts = Equipment._meta
+    sql = f"DELETE FROM {qn(opts.db_table)} WHERE {qn(opts.get_field('upload').column)} = %s"
+    for upload_id in (i for i, source_id in expired if not source_id):
+        with transaction.atomic():
+            heir = UploadHistory.objects.filter(source_id=upload_id).order_by('uploaded_at').first()
+            if heir:
+                Equipment.objects.filter(upload_id=upload_id).update(upload_id=heir.id)
+                UploadAggregate.objects.filter(upload_id=upload_id).update(upload_id=heir.id)
+                UploadHistory.objects.filter(source_id=upload_id).exclude(id=heir.id).update(source_id=heir.id)
+                UploadHistory.objects.filter(id=heir.id).update(source=None)
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [upload_id])
+            # Only the aggregate row and job back-references remain to cascade
+            UploadHistory.objects.filter(id=upload_id).delete()
+
+    evict_report_cache(expired_ids)
+    return expired_ids
+
+def generate_pdf_report(history):
+    """
+    Generates a PDF buffer for the given upload history, loaded through
+    UploadHistory.objects.with_aggregates().
+    """
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     elements = []
     styles = getSampleStyleSheet()
 
-    # Fetch Data
-    try:
-        history = UploadHistory.objects.get(id=history_id)
-        equipments = history.equipments.all()
-    except UploadHistory.DoesNotExist:
-        return None
+    equipments = Equipment.objects.filter(upload_id=history.dataset_id)
 
     # Title
     elements.append(Paragraph(f"Chemical Equipment Report: {history.file_name}", styles['Title']))
@@ -90,6 +437,26 @@ def generate_pdf_report(history_id):
     elements.append(t_summary)
     elements.append(Spacer(1, 20))
 
+    # Distribution Section (precomputed at ingest)
+    stats = get_upload_aggregate(history).metric_stats
+    elements.append(Paragraph("Metric Distribution", styles['Heading2']))
+
+    def fmt(value):
+        return f"{value:.2f}" if value is not None else "-"
+
+    stats_data = [["Metric", "Min", "Median", "P95", "Max", "Std Dev"]]
+    for field in METRIC_FIELDS:
+        metric = stats.get(field) or {}
+        stats_data.append([field.capitalize()] + [fmt(metric.get(k)) for k in ('min', 'p50', 'p95', 'max', 'std')])
+    t_stats = Table(stats_data)
+    t_stats.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    elements.append(t_stats)
+    elements.append(Spacer(1, 20))
+
     # Detailed Table (First 50 records to save space)
     elements.append(Paragraph("Equipment Data (First 50 Records)", styles['Heading2']))
     
@@ -108,4 +475,60 @@ def generate_pdf_report(history_id):
     # Build PDF
     doc.build(elements)
     buffer.seek(0)
-    return buffer
\ No newline at end of file
+    return buffer
+
+def report_cache_path(history):
+    """
+    Cached report of an upload, keyed by report version and by when its rows
+    last changed: a render that loaded the upload before an append commits
+    writes under the old name, which no later request looks up.
+    """
+    stamp = int(history.updated_at.timestamp() * 1_000_000)
+    return os.path.join(settings.REPORT_CACHE_DIR, f"report_{history.id}_v{REPORT_VERSION}_{stamp}.pdf")
+
+def report_etag(f):
+    """
+    Strong validator of an open rendered report, taken from the file itself
+    (render version, size and mtime), so a re-render never reuses the ETag
+    of different bytes even when the upload did not change.
+    """
+    st = os.fstat(f.fileno())
+    return f'"report-v{REPORT_VERSION}-{st.st_size}-{st.st_mtime_ns}"'
+
+def get_report_path(history):
+    """
+    Returns the path of the rendered PDF for an upload (see
+    generate_pdf_report), rendering it into the on-disk cache on first
+    request.
+    """
+    path = report_cache_path(history)
+    if os.path.exists(path):
+        return path
+
+    buffer = generate_pdf_report(history)
+
+    # Write under a unique temporary name, so concurrent renders (threads
+    # included) never share a file and readers never see a partial one
+    os.makedirs(settings.REPORT_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=settings.REPORT_CACHE_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp_path, path)
+
+    # Renders of earlier versions of the upload are never served again
+    for old in glob.glob(os.path.join(settings.REPORT_CACHE_DIR, f"report_{history.id}_v*.pdf")):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return path
+
+def evict_report_cache(history_ids):
+    """Removes cached reports (every version) of the given uploads."""
+    for history_id in history_ids:
+        for path in glob.glob(os.path.join(settings.REPORT_CACHE_DIR, f"report_{history_id}_v*.pdf")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,71 @@
+import glob
+import os
+import threading
+
+from django.conf import settings
+
+from .exports import export_schema, pa
+from .services import EQUIPMENT_FIELDS, iter_equipment_columns
+
+# Columnar copies of datasets on disk (Arrow IPC files), so cross-upload
+# comparisons read whole columns instead of fetching every row through the
+# DB cursor. Optional like the columnar exports: without pyarrow there are
+# no snapshots and callers read the rows themselves.
+
+def snapshot_path(history):
+    """Snapshot of a dataset (an upload owning its rows), keyed by when its rows last changed."""
+    stamp = int(history.updated_at.timestamp() * 1_000_000)
+    return os.path.join(settings.SNAPSHOT_CACHE_DIR, f"dataset_{history.id}_{stamp}.arrow")
+
+def _record_batch(columns, schema):
+    return pa.record_batch([pa.array(columns[f], type=schema.field(f).type) for f in EQUIPMENT_FIELDS],
+                           schema=schema)
+
+def write_snapshot(history, columns=None):
+    """
+    Writes a dataset's equipment columns to its snapshot and removes older
+    snapshots of it. Rows are streamed from the DB one batch at a time, or
+    taken from `columns` when the caller already loaded them. Returns the
+    path, or None without pyarrow.
+    """
+    if pa is None:
+        return None
+    path = snapshot_path(history)
+    os.makedirs(settings.SNAPSHOT_CACHE_DIR, exist_ok=True)
+    schema = export_schema()
+    batches = [columns] if columns is not None else iter_equipment_columns(history.id, EQUIPMENT_FIELDS)
+
+    # Write under a temporary name so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(_record_batch(batch, schema))
+    os.replace(tmp_path, path)
+
+    for old in glob.glob(os.path.join(settings.SNAPSHOT_CACHE_DIR, f"dataset_{history.id}_*.arrow")):
+        if old != path:
+            _remove(old)
+    return path
+
+def load_snapshot(history):
+    """A dataset's columns as NumPy arrays, or None if it has no current snapshot."""
+    if pa is None:
+        return None
+    try:
+        with pa.OSFile(snapshot_path(history), 'rb') as source:
+            table = pa.ipc.open_file(source).read_all()
+    except FileNotFoundError:
+        return None
+    return {f: table.column(f).to_numpy() for f in EQUIPMENT_FIELDS}
+
+def evict_snapshots(history_ids):
+    """Removes the snapshots of the given uploads."""
+    for history_id in history_ids:
+        for path in glob.glob(os.path.join(settings.SNAPSHOT_CACHE_DIR, f"dataset_{history_id}_*.arrow")):
+            _remove(path)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
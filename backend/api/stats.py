@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from collections import Counter
+from io import BytesIO
+
+METRIC_FIELDS = ('flowrate', 'pressure', 'temperature')
+PERCENTILES = (5, 25, 50, 75, 95, 99)
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+class RunningStats:
+    """
+    Mergeable summary of equipment rows, fed one batch at a time so memory
+    stays bounded whatever the dataset size.
+
+    Count, mean and variance use Chan et al.'s pairwise update of Welford's
+    moments; min, max and per-type counts are exact. Percentiles come from a
+    uniform sample of at most `sample_size` rows (bottom-k of random keys,
+    which stays uniform when two summaries are merged), so they are exact
+    until a dataset outgrows the sample.
+    """
+
+    def __init__(self, sample_size, metrics=METRIC_FIELDS):
+        self.metrics = tuple(metrics)
+        self.sample_size = sample_size
+        self.count = 0
+        self.mean = np.zeros(len(self.metrics))
+        self.m2 = np.zeros(len(self.metrics))
+        self.min = np.full(len(self.metrics), np.inf)
+        self.max = np.full(len(self.metrics), -np.inf)
+        self.type_counts = Counter()
+        self.sample_keys = np.empty(0)
+        self.sample_values = np.empty((0, len(self.metrics)))
+        self._rng = np.random.default_rng()
+
+    def update(self, columns):
+        """Folds a batch of normalized columns (see parsing.normalize_frame) in."""
+        values = np.column_stack([np.asarray(columns[m], dtype=np.float64) for m in self.metrics])
+        n = len(values)
+        if not n:
+            return
+        batch = RunningStats(self.sample_size, self.metrics)
+        batch.count = n
+        batch.mean = values.mean(axis=0)
+        batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        batch.min = values.min(axis=0)
+        batch.max = values.max(axis=0)
+        batch.type_counts = Counter(pd.Series(columns['type']).value_counts().to_dict())
+        batch.sample_keys = self._rng.random(n)
+        batch.sample_values = values
+        self.merge(batch)
+
+    def merge(self, other):
+        """Combines another summary into this one, as if both saw all rows."""
+        if not other.count:
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / n
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / n
+        self.count = n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.type_counts.update(other.type_counts)
+
+        self.sample_keys = np.concatenate([self.sample_keys, other.sample_keys])
+        self.sample_values = np.concatenate([self.sample_values, other.sample_values])
+        self._trim_sample()
+        return self
+
+    def _trim_sample(self):
+        if len(self.sample_keys) > self.sample_size:
+            keep = np.argpartition(self.sample_keys, self.sample_size)[:self.sample_size]
+            self.sample_keys, self.sample_values = self.sample_keys[keep], self.sample_values[keep]
+
+    def dumps(self):
+        """Serializes the summary (for UploadAggregate.state) so it can be merged into later."""
+        labels = sorted(self.type_counts)
+        buffer = BytesIO()
+        np.savez(
+            buffer,
+            metrics=np.array(self.metrics),
+            count=np.array(self.count),
+            mean=self.mean, m2=self.m2, min=self.min, max=self.max,
+            type_labels=np.array(labels, dtype=str),
+            type_counts=np.array([self.type_counts[t] for t in labels], dtype=np.int64),
+            sample_keys=self.sample_keys,
+            sample_values=self.sample_values,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def loads(cls, data, sample_size):
+        """Inverse of dumps(); the sample is trimmed if `sample_size` shrank since."""
+        with np.load(BytesIO(bytes(data)), allow_pickle=False) as arrays:
+            stats = cls(sample_size, arrays['metrics'].tolist())
+            stats.count = int(arrays['count'])
+            stats.mean, stats.m2 = arrays['mean'], arrays['m2']
+            stats.min, stats.max = arrays['min'], arrays['max']
+            stats.type_counts = Counter(dict(zip(arrays['type_labels'].tolist(), arrays['type_counts'].tolist())))
+            stats.sample_keys, stats.sample_values = arrays['sample_keys'], arrays['sample_values']
+        stats._trim_sample()
+        return stats
+
+    def means(self):
+        """Per-metric means, or None for an empty summary."""
+        if not self.count:
+            return {m: None for m in self.metrics}
+        return {m: float(v) for m, v in zip(self.metrics, self.mean)}
+
+    def stds(self):
+        """Per-metric sample standard deviations, or None with fewer than two rows."""
+        if self.count < 2:
+            return {m: None for m in self.metrics}
+        return {m: float(v) for m, v in zip(self.metrics, np.sqrt(self.m2 / (self.count - 1)))}
+
+    def to_aggregate(self):
+        """Returns the UploadAggregate fields (including the mergeable state) for this summary."""
+        type_distribution = [{'type': t, 'count': int(c)} for t, c in sorted(self.type_counts.items())]
+
+        metric_stats = {}
+        for i, metric in enumerate(self.metrics):
+            if not self.count:
+                metric_stats[metric] = {}
+                continue
+            stats = {
+                'min': self.min[i],
+                'max': self.max[i],
+                'mean': self.mean[i],
+                'std': np.sqrt(self.m2[i] / (self.count - 1)) if self.count > 1 else np.nan,
+            }
+            for q, value in zip(PERCENTILES, np.percentile(self.sample_values[:, i], PERCENTILES)):
+                stats[f'p{q}'] = value
+            metric_stats[metric] = {k: _finite_or_none(v) for k, v in stats.items()}
+
+        return {'type_distribution': type_distribution, 'metric_stats': metric_stats, 'state': self.dumps()}
@@ -0,0 +1,839 @@
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import services, urls
+from .flags import OUTLIER_FLAGS, outlier_bounds
+from .jobs import run_ingestion
+from .models import Equipment, IngestionJob, UploadAggregate, UploadHistory
+from .services import (append_csv_file, get_report_path, get_upload_aggregate, load_running_stats,
+                       process_csv_file, prune_expired_uploads)
+from .snapshots import write_snapshot
+from .stats import METRIC_FIELDS, RunningStats
+
+CSV_HEADER = "Equipment ID,Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+
+def make_csv(rows=40, shift=0.0):
+    """A small valid upload; every seventh pressure breaches the 7.5 limit."""
+    lines = [f"E{i},Pump {i},T{i % 3},{100 + i},{5 + (i % 7 == 0) * 3 + shift:.2f},{110 + i % 5}\n"
+             for i in range(rows)]
+    return (CSV_HEADER + ''.join(lines)).encode()
+
+def metric_csv(values, start=0):
+    """An upload whose flowrate, pressure and temperature columns are the columns of `values`."""
+    lines = [f"E{start + i},Unit {start + i},T{i % 3},{f:.4f},{p:.4f},{t:.4f}\n"
+             for i, (f, p, t) in enumerate(values)]
+    return (CSV_HEADER + ''.join(lines)).encode()
+
+@override_settings(
+    QUERY_STATS_HEADERS=True,
+    QUERY_BUDGET_STRICT=True,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Pins the number of queries each endpoint runs and checks it against
+    settings.QUERY_BUDGETS, which the middleware enforces (strictly here).
+
+    TransactionTestCase, not TestCase: each test of a TestCase runs inside
+    a transaction, so the BEGIN of an atomic block would be counted as
+    SAVEPOINT plus RELEASE and the counts would not match a live server.
+    """
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        overrides = self.settings(INGEST_SPOOL_DIR=f"{tmp}/spool", REPORT_CACHE_DIR=f"{tmp}/reports",
+                                  SNAPSHOT_CACHE_DIR=f"{tmp}/snapshots")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Queued ingestions stay queued; only the request itself is measured
+        patcher = mock.patch('api.jobs.get_executor')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+        self.user = User.objects.create_user('alice', password='secret-pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def upload(self, name='plant.csv', **kwargs):
+        return process_csv_file(io.BytesIO(make_csv(**kwargs)), self.user, file_name=name)
+
+    def csv_file(self, name='plant.csv'):
+        return SimpleUploadedFile(name, make_csv(), content_type='text/csv')
+
+    def assertQueries(self, expected, method, url_name, kwargs=None, **extra):
+        """Requests an endpoint, checks it ran exactly `expected` queries and returns the response."""
+        self.assertLessEqual(expected, settings.QUERY_BUDGETS[url_name])
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(reverse(url_name, kwargs=kwargs), **extra)
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+        # Django logs COMMIT/ROLLBACK too, but they never pass through a cursor,
+        # so the middleware (and its budgets) does not count them
+        statements = [q['sql'] for q in queries.captured_queries if q['sql'] not in ('COMMIT', 'ROLLBACK')]
+        self.assertEqual(len(statements), expected, '\n'.join(statements))
+        self.assertEqual(response['X-DB-Query-Count'], str(expected))
+        return response
+
+    def test_every_endpoint_has_a_budget(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names, set(settings.QUERY_BUDGETS))
+
+    def test_register(self):
+        self.client.credentials()
+        self.assertQueries(3, 'post', 'register', data={'username': 'bob', 'password': 'secret-pw'})
+
+    def test_login(self):
+        self.client.credentials()
+        User.objects.create_user('bob', password='secret-pw')
+        credentials = {'username': 'bob', 'password': 'secret-pw'}
+        # The first login creates the token inside a transaction
+        first = self.assertQueries(4, 'post', 'login', data=credentials)
+        repeat = self.assertQueries(2, 'post', 'login', data=credentials)
+        self.assertEqual(first.data['token'], repeat.data['token'])
+
+    def test_file_upload(self):
+        response = self.assertQueries(2, 'post', 'file-upload', data={'file': self.csv_file()}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+
+    def test_upload_append(self):
+        upload = self.upload()
+        self.assertQueries(3, 'post', 'upload-append', {'upload_id': upload.id},
+                           data={'file': self.csv_file()}, format='multipart')
+
+    def test_upload_batch(self):
+        files = [self.csv_file(f'plant-{i}.csv') for i in range(3)]
+        response = self.assertQueries(3, 'post', 'upload-batch', data={'files': files}, format='multipart')
+        self.assertEqual(len(response.data['jobs']), 3)
+
+    def test_upload_batch_status(self):
+        files = [self.csv_file(f'plant-{i}.csv') for i in range(3)]
+        batch = self.client.post(reverse('upload-batch'), {'files': files}, format='multipart').data['batch']
+        self.assertQueries(2, 'get', 'upload-batch-status', {'batch_id': batch})
+
+    def test_ingestion_job(self):
+        job = IngestionJob.objects.create(user=self.user, file_name='plant.csv', upload=self.upload())
+        self.assertQueries(2, 'get', 'ingestion-job', {'pk': job.id})
+
+    def test_dashboard_data(self):
+        self.upload()
+        cold = self.assertQueries(3, 'get', 'dashboard-data')
+        self.assertQueries(2, 'get', 'dashboard-data')
+        response = self.assertQueries(2, 'get', 'dashboard-data', HTTP_IF_NONE_MATCH=cold['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_upload_equipment(self):
+        upload = self.upload()
+        self.assertQueries(3, 'get', 'upload-equipment', {'upload_id': upload.id})
+
+    def test_upload_export(self):
+        upload = self.upload()
+        # Rows are read while the response streams, after the request is counted
+        for file_format in ('arrow', 'parquet'):
+            self.assertQueries(2, 'get', 'upload-export', {'upload_id': upload.id, 'file_format': file_format})
+
+    def test_charts(self):
+        upload = self.upload()
+        kwargs = {'upload_id': upload.id}
+        self.assertQueries(3, 'get', 'chart-top', kwargs)
+        self.assertQueries(3, 'get', 'chart-histogram', kwargs)
+        self.assertQueries(3, 'get', 'chart-types', kwargs)
+        self.assertQueries(4, 'get', 'upload-critical', kwargs)
+        self.assertQueries(4, 'get', 'upload-critical', kwargs, data={'metric': 'pressure'})
+
+    def test_upload_compare(self):
+        base = self.upload('a.csv')
+        changed = self.upload('b.csv', shift=1.0)
+        duplicate = self.upload('a-copy.csv')
+        ids = ','.join(str(u.id) for u in (base, changed, duplicate))
+        # Cold: one scan per dataset (the duplicate shares the first one), then snapshotted
+        self.assertQueries(4, 'get', 'upload-compare', data={'ids': ids})
+        self.assertQueries(2, 'get', 'upload-compare', data={'ids': ids})
+
+    def test_upload_compare_retained_uploads_cold(self):
+        uploads = [self.upload(f'{i}.csv', shift=i) for i in range(settings.UPLOAD_RETENTION)]
+        ids = ','.join(str(u.id) for u in uploads)
+        self.assertQueries(2 + len(uploads), 'get', 'upload-compare', data={'ids': ids})
+
+    def test_history_list(self):
+        self.upload()
+        self.assertQueries(3, 'get', 'history-list')
+        self.assertQueries(2, 'get', 'history-list')
+
+    def test_pdf_report(self):
+        self.upload()
+        # Cold: the latest upload is loaded once, with its aggregate, then its first rows
+        cold = self.assertQueries(3, 'get', 'pdf-report')
+        self.assertQueries(2, 'get', 'pdf-report')
+        response = self.assertQueries(2, 'get', 'pdf-report', HTTP_IF_NONE_MATCH=cold['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+class OutlierFlagTests(TestCase):
+    """Appends re-flag only the rows whose outlier bits can change."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.rng = np.random.default_rng(7)
+
+    def flags(self, upload):
+        return dict(Equipment.objects.filter(upload=upload).values_list('id', 'flags'))
+
+    def assertFlagsMatchAggregate(self, upload):
+        """Every row's outlier bits are what a full pass with the stored summary would set."""
+        stats = load_running_stats(get_upload_aggregate(upload))
+        bounds = outlier_bounds(stats.means(), stats.stds(), settings.CRITICAL_ZSCORE)
+        for row in Equipment.objects.filter(upload=upload).values('flags', *METRIC_FIELDS):
+            expected = sum(OUTLIER_FLAGS[m] for m, bound in bounds.items() if bound and not bound[0] <= row[m] <= bound[1])
+            self.assertEqual(row['flags'] & sum(OUTLIER_FLAGS.values()), expected, row)
+
+    def test_append_touches_only_rows_between_old_and_new_bounds(self):
+        means, spreads = np.array([50.0, 5.0, 100.0]), np.array([5.0, 0.5, 10.0])
+        base = self.rng.normal(means, spreads, size=(2000, 3))
+        upload = process_csv_file(io.BytesIO(metric_csv(base)), self.user, file_name='base.csv')
+        self.assertFlagsMatchAggregate(upload)
+        before = self.flags(upload)
+
+        # Rows well inside the bounds that still shift the mean, plus three far outliers
+        extra = np.vstack([np.tile(means + 1.2 * spreads, (200, 1)), np.tile(means + 8 * spreads, (3, 1))])
+        original = services._flag_outliers
+        touched = []
+
+        def flag_outliers(*args, **kwargs):
+            touched.append(original(*args, **kwargs))
+            return touched[-1]
+
+        with mock.patch('api.services._flag_outliers', side_effect=flag_outliers):
+            append_csv_file(io.BytesIO(metric_csv(extra, start=len(base))), upload.id)
+
+        after = self.flags(upload)
+        changed = sum(after[row_id] != flags for row_id, flags in before.items())
+        self.assertGreater(changed, 0)
+        self.assertEqual(touched, [changed + 3])
+        self.assertLess(touched[0], len(before) // 20)
+        self.assertFlagsMatchAggregate(UploadHistory.objects.get(pk=upload.id))
+
+
+class RecoverIngestionJobsTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        overrides = self.settings(INGEST_SPOOL_DIR=tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('alice')
+
+    def job(self, status):
+        job = IngestionJob.objects.create(user=self.user, file_name='plant.csv', status=status)
+        path = f"{settings.INGEST_SPOOL_DIR}/{job.id}.csv"
+        with open(path, 'wb') as f:
+            f.write(make_csv())
+        return job, path
+
+    def test_command_fails_interrupted_jobs_and_removes_their_spool_files(self):
+        queued, queued_path = self.job(IngestionJob.STATUS_QUEUED)
+        running, running_path = self.job(IngestionJob.STATUS_RUNNING)
+        done = IngestionJob.objects.create(user=self.user, file_name='done.csv',
+                                           status=IngestionJob.STATUS_COMPLETED)
+        partial = f"{settings.INGEST_SPOOL_DIR}/tmp123.upload"
+        open(partial, 'wb').close()
+
+        out = io.StringIO()
+        call_command('recover_ingestion_jobs', stdout=out)
+
+        self.assertIn('Failed 2', out.getvalue())
+        for job in (queued, running):
+            job.refresh_from_db()
+            self.assertEqual(job.status, IngestionJob.STATUS_FAILED)
+            self.assertEqual(job.error, "Interrupted by a server restart")
+            self.assertIsNotNone(job.finished_at)
+        done.refresh_from_db()
+        self.assertEqual(done.status, IngestionJob.STATUS_COMPLETED)
+        for path in (queued_path, running_path, partial):
+            self.assertFalse(os.path.exists(path))
+
+    def test_requests_leave_other_processes_jobs_alone(self):
+        job, path = self.job(IngestionJob.STATUS_RUNNING)
+        self.client.get(reverse('history-list'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.STATUS_RUNNING)
+        self.assertTrue(os.path.exists(path))
+
+
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        overrides = self.settings(REPORT_CACHE_DIR=tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('alice')
+        self.upload = process_csv_file(io.BytesIO(make_csv()), self.user, file_name='plant.csv')
+
+    def load(self):
+        return UploadHistory.objects.with_aggregates().get(pk=self.upload.id)
+
+    def test_render_started_before_an_append_is_never_served(self):
+        stale = self.load()
+        append_csv_file(io.BytesIO(make_csv(rows=5)), self.upload.id)
+        # The slow render finishes after the append committed (and evicted the cache)
+        stale_path = get_report_path(stale)
+
+        fresh_path = get_report_path(self.load())
+        self.assertNotEqual(fresh_path, stale_path)
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertEqual(get_report_path(self.load()), fresh_path)
+
+    def test_concurrent_renders_in_one_process_do_not_mix(self):
+        rendered, written = threading.Barrier(2, timeout=10), threading.Barrier(2, timeout=10)
+        size = 4 * 2**20
+        replace = os.replace
+
+        def render(history):
+            rendered.wait()
+            return BytesIO(bytes([threading.get_ident() % 251]) * size)
+
+        def move_into_place(src, dst):
+            # Both renders are written before either is moved into place
+            written.wait()
+            replace(src, dst)
+
+        errors = []
+
+        def run():
+            try:
+                get_report_path(history)
+            except Exception as e:
+                errors.append(e)
+
+        history = self.load()
+        with mock.patch('api.services.generate_pdf_report', side_effect=render), \
+                mock.patch('api.services.os.replace', side_effect=move_into_place):
+            threads = [threading.Thread(target=run) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        with open(get_report_path(history), 'rb') as f:
+            data = f.read()
+        self.assertEqual(len(data), size)
+        self.assertEqual(len(set(data)), 1)
+        self.assertEqual(os.listdir(settings.REPORT_CACHE_DIR), [os.path.basename(get_report_path(history))])
+
+
+@override_settings(AGGREGATE_SAMPLE_SIZE=64, INGEST_BATCH_SIZE=50)
+class RunningStatsTests(TestCase):
+    """Summaries merged from partial streams, or stored and loaded again, match a single pass."""
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        # Rounded as metric_csv() writes them, so ingested rows equal these exactly
+        self.values = rng.normal([50.0, 5.0, 100.0], [5.0, 0.5, 10.0], size=(300, 3)).round(4)
+
+    def columns(self, start, stop):
+        part = self.values[start:stop]
+        return {'type': [f"T{i % 3}" for i in range(start, stop)],
+                **{m: part[:, i] for i, m in enumerate(METRIC_FIELDS)}}
+
+    def summary(self, sample_size, *bounds):
+        stats = RunningStats(sample_size)
+        for start, stop in bounds:
+            stats.update(self.columns(start, stop))
+        return stats
+
+    def assertSameMoments(self, stats, expected):
+        self.assertEqual(stats.count, expected.count)
+        self.assertEqual(stats.type_counts, expected.type_counts)
+        np.testing.assert_allclose(stats.mean, expected.mean)
+        np.testing.assert_allclose(stats.m2, expected.m2)
+        np.testing.assert_array_equal(stats.min, expected.min)
+        np.testing.assert_array_equal(stats.max, expected.max)
+
+    def assertSampleOfRows(self, stats, size):
+        self.assertEqual(stats.sample_values.shape, (size, len(METRIC_FIELDS)))
+        rows = {tuple(row) for row in self.values}
+        self.assertTrue(all(tuple(row) in rows for row in stats.sample_values))
+
+    def test_merging_partial_streams_matches_a_single_pass(self):
+        # A sample as large as the data holds every row, so percentiles are exact too
+        single = self.summary(300, (0, 300))
+        merged = self.summary(300, (0, 70), (70, 110)).merge(self.summary(300, (110, 300)))
+        self.assertSameMoments(merged, single)
+
+        for metric, stats in merged.to_aggregate()['metric_stats'].items():
+            expected = single.to_aggregate()['metric_stats'][metric]
+            self.assertEqual(stats.keys(), expected.keys())
+            for key, value in stats.items():
+                self.assertAlmostEqual(value, expected[key], places=9, msg=f"{metric} {key}")
+
+    def test_merged_sample_is_bounded_and_drawn_from_the_rows(self):
+        merged = self.summary(64, (0, 40)).merge(self.summary(64, (40, 300)))
+        self.assertSameMoments(merged, self.summary(64, (0, 300)))
+        self.assertSampleOfRows(merged, 64)
+        for i, metric in enumerate(METRIC_FIELDS):
+            stats = merged.to_aggregate()['metric_stats'][metric]
+            self.assertTrue(self.values[:, i].min() <= stats['p5'] <= stats['p50'] <= stats['p95'] <= self.values[:, i].max())
+
+    def test_dumps_loads_round_trip(self):
+        stats = self.summary(64, (0, 200))
+        loaded = RunningStats.loads(stats.dumps(), 64)
+        self.assertSameMoments(loaded, stats)
+        np.testing.assert_array_equal(loaded.sample_keys, stats.sample_keys)
+        np.testing.assert_array_equal(loaded.sample_values, stats.sample_values)
+        self.assertEqual(loaded.to_aggregate()['metric_stats'], stats.to_aggregate()['metric_stats'])
+
+        # A loaded summary merges exactly like the one it was saved from
+        rest = self.summary(64, (200, 300))
+        self.assertEqual(RunningStats.loads(stats.dumps(), 64).merge(rest).to_aggregate()['metric_stats'],
+                         stats.merge(rest).to_aggregate()['metric_stats'])
+
+        # A smaller sample size setting trims the stored sample to the lowest keys
+        trimmed = RunningStats.loads(stats.dumps(), 16)
+        self.assertSampleOfRows(trimmed, 16)
+        np.testing.assert_array_equal(np.sort(trimmed.sample_keys), np.sort(stats.sample_keys)[:16])
+
+    def test_ingest_then_append_matches_a_single_pass(self):
+        user = User.objects.create_user('alice')
+        upload = process_csv_file(io.BytesIO(metric_csv(self.values[:180])), user, file_name='base.csv')
+        append_csv_file(io.BytesIO(metric_csv(self.values[180:], start=180)), upload.id)
+
+        upload = UploadHistory.objects.get(pk=upload.id)
+        stored = load_running_stats(get_upload_aggregate(upload))
+        self.assertSameMoments(stored, self.summary(64, (0, 300)))
+        self.assertSampleOfRows(stored, 64)
+        self.assertEqual(upload.total_records, 300)
+
+
+class DeduplicationTests(TestCase):
+    """Repeat uploads share their source's rows until either side is modified."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+
+    def upload(self, data, user=None, name='plant.csv'):
+        return process_csv_file(io.BytesIO(data), user or self.user, file_name=name)
+
+    def append(self, upload, rows=10):
+        append_csv_file(io.BytesIO(make_csv(rows, shift=1.0)), upload.id)
+        return UploadHistory.objects.get(pk=upload.id)
+
+    def rows(self, upload):
+        return Equipment.objects.filter(upload=upload).count()
+
+    def test_repeat_upload_points_at_the_stored_rows(self):
+        source = self.upload(make_csv())
+        duplicate = self.upload(make_csv(), name='again.csv')
+
+        self.assertEqual(duplicate.source_id, source.id)
+        self.assertEqual(duplicate.content_hash, source.content_hash)
+        self.assertEqual((self.rows(source), self.rows(duplicate)), (40, 0))
+        self.assertEqual(duplicate.total_records, 40)
+        self.assertEqual(get_upload_aggregate(duplicate).upload_id, source.id)
+
+    def test_different_content_or_user_is_ingested_again(self):
+        source = self.upload(make_csv())
+        changed = self.upload(make_csv(shift=0.5))
+        other = self.upload(make_csv(), user=User.objects.create_user('bob'))
+
+        for upload in (changed, other):
+            self.assertIsNone(upload.source_id)
+            self.assertEqual(self.rows(upload), 40)
+        self.assertNotEqual(changed.content_hash, source.content_hash)
+        self.assertEqual(self.rows(source), 40)
+
+    def test_appending_to_a_duplicate_copies_the_rows_first(self):
+        source = self.upload(make_csv())
+        duplicate = self.append(self.upload(make_csv()))
+
+        self.assertIsNone(duplicate.source_id)
+        self.assertEqual((self.rows(source), self.rows(duplicate)), (40, 50))
+        self.assertEqual(duplicate.total_records, 50)
+        self.assertEqual(UploadHistory.objects.get(pk=source.id).total_records, 40)
+        self.assertEqual(get_upload_aggregate(duplicate).upload_id, duplicate.id)
+        # The appended upload no longer matches its file, so the next repeat uses the source
+        self.assertEqual(self.upload(make_csv()).source_id, source.id)
+
+    def test_appending_to_a_source_hands_its_rows_to_the_oldest_duplicate(self):
+        source = self.upload(make_csv())
+        heir = self.upload(make_csv())
+        other = self.upload(make_csv())
+        source = self.append(source)
+
+        heir.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((source.source_id, heir.source_id, other.source_id), (None, None, heir.id))
+        self.assertEqual((self.rows(source), self.rows(heir), self.rows(other)), (50, 40, 0))
+        self.assertEqual(source.content_hash, '')
+        self.assertEqual(get_upload_aggregate(other).upload_id, heir.id)
+        self.assertEqual(load_running_stats(get_upload_aggregate(heir)).count, 40)
+        self.assertEqual(self.upload(make_csv()).source_id, heir.id)
+
+
+class PruneExpiredUploadsTests(TestCase):
+    """Retention deletes expired rows, except for datasets retained duplicates still read."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.start = timezone.now() - timedelta(days=1)
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        patcher = override_settings(REPORT_CACHE_DIR=tmp)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def upload(self, data):
+        upload = process_csv_file(io.BytesIO(data), self.user, file_name='plant.csv')
+        # Distinct, increasing upload times decide both retention and the heir
+        minutes = UploadHistory.objects.filter(user=self.user).count()
+        UploadHistory.objects.filter(pk=upload.pk).update(uploaded_at=self.start + timedelta(minutes=minutes))
+        return upload
+
+    def state(self, *uploads):
+        """(rows, source id) per upload, or None for deleted ones."""
+        sources = dict(UploadHistory.objects.values_list('id', 'source_id'))
+        return [(Equipment.objects.filter(upload_id=u.id).count(), sources[u.id]) if u.id in sources else None
+                for u in uploads]
+
+    def test_expired_uploads_and_their_rows_are_deleted(self):
+        old, duplicate, kept = self.upload(make_csv()), self.upload(make_csv()), self.upload(make_csv(shift=0.5))
+
+        self.assertCountEqual(prune_expired_uploads(self.user.id, keep=1), [old.id, duplicate.id])
+        self.assertEqual(self.state(old, duplicate, kept), [None, None, (40, None)])
+        self.assertEqual(Equipment.objects.count(), 40)
+        self.assertEqual(list(UploadAggregate.objects.values_list('upload_id', flat=True)), [kept.id])
+
+    def test_expired_duplicate_leaves_its_source_intact(self):
+        source, duplicate, newest = self.upload(make_csv()), self.upload(make_csv()), self.upload(make_csv(shift=0.5))
+        UploadHistory.objects.filter(pk=source.pk).update(uploaded_at=self.start + timedelta(minutes=10))
+
+        self.assertCountEqual(prune_expired_uploads(self.user.id, keep=2), [duplicate.id])
+        self.assertEqual(self.state(source, duplicate, newest), [(40, None), None, (40, None)])
+
+    def test_expired_source_hands_its_rows_to_the_oldest_retained_duplicate(self):
+        source = self.upload(make_csv())
+        expired_duplicate, heir, other = (self.upload(make_csv()) for _ in range(3))
+        self.assertEqual(self.state(source, heir, other), [(40, None), (0, source.id), (0, source.id)])
+        aggregate_id = get_upload_aggregate(source).id
+
+        self.assertCountEqual(prune_expired_uploads(self.user.id, keep=2), [source.id, expired_duplicate.id])
+        self.assertEqual(self.state(source, expired_duplicate, heir, other), [None, None, (40, None), (0, heir.id)])
+        self.assertEqual(Equipment.objects.count(), 40)
+
+        heir, other = UploadHistory.objects.get(pk=heir.id), UploadHistory.objects.get(pk=other.id)
+        self.assertEqual(get_upload_aggregate(heir).id, aggregate_id)
+        self.assertEqual(get_upload_aggregate(other).id, aggregate_id)
+        self.assertEqual(load_running_stats(get_upload_aggregate(other)).count, 40)
+
+
+class SpoolingUploadHandlerTests(TestCase):
+    """Uploads are streamed (and gzip inflated) into the spool, or rejected without leaving files behind."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.spool = f"{tmp}/spool"
+        overrides = self.settings(INGEST_SPOOL_DIR=self.spool)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch('api.jobs.get_executor')
+        self.executor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.csv = make_csv()
+
+    def post_multipart(self, name, data, content_type):
+        file = SimpleUploadedFile(name, data, content_type=content_type)
+        return self.client.post(reverse('file-upload'), {'file': file}, format='multipart')
+
+    def post_raw(self, data, **headers):
+        return self.client.post(reverse('file-upload'), data, content_type='text/csv',
+                                HTTP_CONTENT_DISPOSITION='attachment; filename=plant.csv', **headers)
+
+    def assertSpooledCsv(self, response):
+        """The job's spool file holds the plain CSV, hashed as if it had been uploaded uncompressed."""
+        self.assertEqual(response.status_code, 202, response.data)
+        job = IngestionJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.file_name, 'plant.csv')
+        path = os.path.join(self.spool, f"{job.id}.csv")
+        self.assertEqual(os.listdir(self.spool), [os.path.basename(path)])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.csv)
+        self.executor.return_value.submit.assert_called_once_with(
+            run_ingestion, job.id, path, hashlib.sha256(self.csv).hexdigest(), None)
+
+    def assertRejected(self, response, status_code):
+        self.assertEqual(response.status_code, status_code)
+        self.assertEqual(os.listdir(self.spool), [])
+        self.assertFalse(IngestionJob.objects.exists())
+
+    def test_plain_csv_is_spooled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_multipart('plant.csv', self.csv, 'text/csv')
+        self.assertSpooledCsv(response)
+
+    def test_gzip_multipart_upload_is_inflated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_multipart('plant.csv.gz', gzip.compress(self.csv), 'application/gzip')
+        self.assertSpooledCsv(response)
+
+    def test_gzip_raw_body_is_inflated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_raw(gzip.compress(self.csv), HTTP_CONTENT_ENCODING='gzip')
+        self.assertSpooledCsv(response)
+
+    def test_concatenated_gzip_members_are_inflated(self):
+        half = self.csv.index(b'\nE20,') + 1
+        data = gzip.compress(self.csv[:half]) + gzip.compress(self.csv[half:])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_multipart('plant.csv.gz', data, 'application/gzip')
+        self.assertSpooledCsv(response)
+
+    def test_upload_inflating_past_the_limit_is_rejected(self):
+        # Compresses to a few kilobytes but inflates to several chunks
+        self.csv = make_csv(rows=20000)
+        data = gzip.compress(self.csv)
+        limit = len(self.csv) // 2
+        self.assertLess(len(data), limit)
+        with self.settings(MAX_INFLATED_UPLOAD_SIZE=limit):
+            self.assertRejected(self.post_multipart('plant.csv.gz', data, 'application/gzip'), 413)
+            self.assertRejected(self.post_raw(data, HTTP_CONTENT_ENCODING='gzip'), 413)
+
+    def test_plain_upload_is_not_held_to_the_inflated_limit(self):
+        with self.settings(MAX_INFLATED_UPLOAD_SIZE=len(self.csv) // 2), self.captureOnCommitCallbacks(execute=True):
+            response = self.post_multipart('plant.csv', self.csv, 'text/csv')
+        self.assertSpooledCsv(response)
+
+    def test_corrupt_gzip_is_rejected(self):
+        data = gzip.compress(self.csv)
+        corrupt = data[:10] + bytes(b ^ 0xFF for b in data[10:40]) + data[40:]
+        self.assertRejected(self.post_multipart('plant.csv.gz', corrupt, 'application/gzip'), 400)
+        self.assertRejected(self.post_raw(self.csv, HTTP_CONTENT_ENCODING='gzip'), 400)
+
+    def test_truncated_gzip_is_rejected(self):
+        truncated = gzip.compress(self.csv)[:-20]
+        self.assertRejected(self.post_multipart('plant.csv.gz', truncated, 'application/gzip'), 400)
+        self.assertRejected(self.post_raw(truncated, HTTP_CONTENT_ENCODING='gzip'), 400)
+
+
+class HistogramChartTests(TestCase):
+    """Database-side binning matches numpy.histogram, edges included."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Flowrates on every bin edge of [0, 10] in 5 bins, plus two outside it
+        self.flowrates = [0.0, 1.0, 2.0, 3.9999, 4.0, 6.0, 8.0, 9.5, 10.0, 10.0, -0.5, 10.5]
+        values = [(f, 5.0, 100.0) for f in self.flowrates]
+        self.upload = process_csv_file(io.BytesIO(metric_csv(values)), self.user, file_name='plant.csv')
+
+    def histogram(self, upload=None, **params):
+        url = reverse('chart-histogram', kwargs={'upload_id': (upload or self.upload).id})
+        return self.client.get(url, {'metric': 'flowrate', **params})
+
+    def test_bins_match_numpy_including_both_outer_edges(self):
+        response = self.histogram(bins=5, min=0, max=10)
+        self.assertEqual(response.status_code, 200)
+        counts, edges = np.histogram(self.flowrates, bins=5, range=(0, 10))
+        self.assertEqual(response.data['counts'], counts.tolist())
+        self.assertEqual(response.data['edges'], edges.tolist())
+        self.assertEqual(response.data['counts'], [2, 2, 1, 1, 4])
+
+    def test_range_defaults_to_the_metric_min_and_max(self):
+        response = self.histogram(bins=4)
+        counts, edges = np.histogram(self.flowrates, bins=4)
+        self.assertEqual(response.data['counts'], counts.tolist())
+        self.assertEqual(response.data['edges'], edges.tolist())
+
+    def test_zero_width_range_counts_every_matching_row_once(self):
+        response = self.histogram(bins=3, min=10, max=10)
+        self.assertEqual(response.data['counts'], [2, 0, 0])
+
+    def test_upload_without_rows_has_no_bins(self):
+        empty = process_csv_file(io.BytesIO(CSV_HEADER.encode()), self.user, file_name='empty.csv')
+        response = self.histogram(empty)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['edges'], response.data['counts']), ([], []))
+
+    def test_invalid_bounds_are_rejected(self):
+        for bounds in ({'min': 'nan', 'max': 10}, {'min': 0, 'max': 'inf'}, {'min': '-inf', 'max': 'inf'},
+                       {'min': 'low', 'max': 10}, {'min': 10, 'max': 0}):
+            with self.subTest(**bounds):
+                response = self.histogram(bins=5, **bounds)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('range', response.data)
+
+
+class ReportRangeTests(TestCase):
+    """Report downloads resume with Range, but only within the same rendered file."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        overrides = self.settings(REPORT_CACHE_DIR=tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.pdf = bytes(range(256)) * 40
+        patcher = mock.patch('api.services.generate_pdf_report', side_effect=lambda history: BytesIO(self.pdf))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user('alice')
+        self.upload = process_csv_file(io.BytesIO(make_csv()), self.user, file_name='plant.csv')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **headers):
+        response = self.client.get(reverse('pdf-report'), **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_download_advertises_ranges(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.pdf)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_satisfiable_range_resumes_the_same_render(self):
+        etag = self.get()[0]['ETag']
+        for header, start, end in (('bytes=1000-', 1000, len(self.pdf) - 1), ('bytes=10-19', 10, 19),
+                                   ('bytes=-100', len(self.pdf) - 100, len(self.pdf) - 1)):
+            with self.subTest(header):
+                response, body = self.get(HTTP_RANGE=header, HTTP_IF_RANGE=etag)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, self.pdf[start:end + 1])
+                self.assertEqual(response['Content-Range'], f"bytes {start}-{end}/{len(self.pdf)}")
+                self.assertEqual(response['ETag'], etag)
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(HTTP_RANGE=f"bytes={len(self.pdf)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(self.pdf)}")
+        self.assertEqual(body, b'')
+
+    def test_stale_if_range_gets_the_whole_new_render(self):
+        etag = self.get()[0]['ETag']
+        append_csv_file(io.BytesIO(make_csv(rows=5)), self.upload.id)
+        self.pdf = bytes(reversed(self.pdf))
+
+        response, body = self.get(HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.pdf)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_range_of_an_evicted_render_gets_the_whole_file(self):
+        # Re-rendering the same upload yields a new file, so the old validator must not match it
+        etag = self.get()[0]['ETag']
+        services.evict_report_cache([self.upload.id])
+
+        response, body = self.get(HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.pdf)
+
+
+class ComparisonSnapshotTests(TestCase):
+    """Comparisons read from Arrow snapshots give exactly what a scan of the rows gives."""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.snapshots = tmp
+        overrides = self.settings(SNAPSHOT_CACHE_DIR=tmp)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user('alice')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        rng = np.random.default_rng(3)
+        values = rng.normal([50.0, 5.0, 100.0], [5.0, 0.5, 10.0], size=(60, 3))
+        changed = values[10:].copy()
+        changed[::4] += [1.0, -0.25, 3.0]
+        # Rows 0-9 removed, 60-69 added, and E20 repeated (its last row counts)
+        extra = rng.normal([50.0, 5.0, 100.0], [5.0, 0.5, 10.0], size=(10, 3))
+        changed_csv = metric_csv(np.vstack([changed, extra]), start=10) + b"E20,Unit 20,T9,1.0,2.0,3.0\n"
+
+        self.base = self.upload(metric_csv(values))
+        self.duplicate = self.upload(metric_csv(values))
+        self.changed = self.upload(changed_csv)
+        self.assertEqual(self.duplicate.source_id, self.base.id)
+
+    def upload(self, data):
+        return process_csv_file(io.BytesIO(data), self.user, file_name='plant.csv')
+
+    def compare(self, base=None):
+        ids = [base or self.base, self.changed, self.duplicate]
+        response = self.client.get(reverse('upload-compare'), {'ids': ','.join(str(u.id) for u in ids), 'limit': 100})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def scanned(self, base=None):
+        """The comparison without pyarrow, i.e. from the rows alone."""
+        with mock.patch('api.snapshots.pa', None):
+            payload = self.compare(base)
+        self.assertEqual(os.listdir(self.snapshots), [])
+        return payload
+
+    def write_snapshots(self):
+        for upload in (self.base, self.changed):
+            write_snapshot(UploadHistory.objects.get(pk=upload.id))
+
+    def test_snapshot_matches_the_fallback_scan(self):
+        expected = self.scanned()
+        equipment = expected['comparisons'][0]['equipment']
+        self.assertEqual((equipment['matched'], equipment['added'], equipment['removed']), (50, 10, 10))
+        # Every fourth matched row, plus the repeated E20
+        self.assertEqual(equipment['changed'], 14)
+        self.assertEqual(expected['comparisons'][1]['equipment']['changed'], 0)
+
+        self.write_snapshots()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.compare(), expected)
+        self.assertFalse([q for q in queries.captured_queries if Equipment._meta.db_table in q['sql']])
+
+    def test_missing_snapshots_are_written_by_the_first_comparison(self):
+        expected = self.scanned()
+        self.assertEqual(self.compare(), expected)
+        self.assertEqual(len(os.listdir(self.snapshots)), 2)
+        self.assertEqual(self.compare(), expected)
+
+    def test_snapshot_of_an_appended_dataset_is_not_reused(self):
+        self.write_snapshots()
+        before = self.compare()
+        append_csv_file(io.BytesIO(metric_csv([(1.0, 2.0, 3.0)], start=0)), self.base.id)
+        base = UploadHistory.objects.get(pk=self.base.id)
+
+        after = self.compare(base)
+        self.assertNotEqual(after, before)
+        for name in os.listdir(self.snapshots):
+            os.remove(os.path.join(self.snapshots, name))
+        self.assertEqual(after, self.scanned(base))
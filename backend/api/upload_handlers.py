@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+
+GZIP_CONTENT_TYPES = {'application/gzip', 'application/x-gzip'}
+
+class InflatedUploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The uploaded file is too large once decompressed"
+    default_code = 'inflated_upload_too_large'
+
+def _is_gzip(request, file_name, content_type):
+    """A `.gz` file, a gzip content type, or a raw body sent with Content-Encoding: gzip."""
+    return (request.META.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip'
+            or (file_name or '').lower().endswith('.gz')
+            or content_type in GZIP_CONTENT_TYPES)
+
+class SpooledUploadedFile(UploadedFile):
+    """
+    An upload already written to the ingestion spool directory. The file is
+    removed when closed (Django closes uploads at the end of the request)
+    unless an ingestion job has claimed it first.
+    """
+
+    def __init__(self, path, content_hash, name, content_type, size, charset, content_type_extra=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.spool_path = path
+        self.content_hash = content_hash
+        self._claimed = False
+
+    def temporary_file_path(self):
+        return self.spool_path
+
+    def claim(self):
+        """Hands the spooled file over to the caller and returns its path."""
+        self.file.close()
+        self._claimed = True
+        return self.spool_path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            if not self._claimed and os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+
+class SpoolingUploadHandler(FileUploadHandler):
+    """
+    Streams each uploaded file chunk by chunk straight into INGEST_SPOOL_DIR,
+    so a CSV of any size never sits in memory and is written to disk exactly
+    once; the ingestion job then takes the file over with a rename instead
+    of a copy. The SHA-256 used for deduplication is computed on the way.
+
+    Gzip-compressed uploads (`.csv.gz`, or a raw body with Content-Encoding:
+    gzip) are inflated as they arrive, so the spool, the hash and the
+    parser only ever see plain CSV and a compressed repeat of an upload
+    still deduplicates against the original. Inflating yields at most
+    chunk_size bytes at a time, and an upload that grows past
+    MAX_INFLATED_UPLOAD_SIZE is rejected (413), so a gzip bomb can neither
+    blow up memory nor fill the spool.
+    """
+    chunk_size = 256 * 2 ** 10
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix='.upload', dir=settings.INGEST_SPOOL_DIR)
+        self.destination = os.fdopen(fd, 'wb')
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.inflater = None
+        if _is_gzip(self.request, self.file_name, self.content_type):
+            self.inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if self.file_name.lower().endswith('.gz'):
+                self.file_name = self.file_name[:-3]
+            self.content_type = 'text/csv'
+
+    def _write(self, data):
+        if self.inflater is not None and self.size + len(data) > settings.MAX_INFLATED_UPLOAD_SIZE:
+            self.upload_interrupted()
+            raise InflatedUploadTooLarge()
+        self.destination.write(data)
+        self.hasher.update(data)
+        self.size += len(data)
+
+    def _fail(self, message):
+        self.upload_interrupted()
+        raise ParseError(message)
+
+    def _inflate(self, data):
+        """Writes out everything `data` inflates to, chunk_size bytes at a time."""
+        while True:
+            out = self.inflater.decompress(data, self.chunk_size)
+            self._write(out)
+            if self.inflater.eof and self.inflater.unused_data:
+                # Concatenated gzip members (e.g. from appending .gz files)
+                data = self.inflater.unused_data
+                self.inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                continue
+            data = self.inflater.unconsumed_tail
+            # A full chunk may leave more output pending even with no input left
+            if not data and (self.inflater.eof or len(out) < self.chunk_size):
+                return
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.inflater is None:
+            self._write(raw_data)
+            return
+        try:
+            self._inflate(raw_data)
+        except zlib.error:
+            self._fail("The uploaded file is not valid gzip data")
+
+    def file_complete(self, file_size):
+        if self.inflater is not None:
+            if not self.inflater.eof:
+                self._fail("The uploaded gzip file is truncated")
+        self.destination.close()
+        return SpooledUploadedFile(
+            self.path, self.hasher.hexdigest(), self.file_name, self.content_type, self.size,
+            self.charset, self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'destination'):
+            self.destination.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
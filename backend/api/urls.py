@@ -1,13 +1,27 @@
 from django.urls import path
 from rest_framework.authtoken.views import obtain_auth_token 
-from .views import FileUploadView, DashboardDataView, HistoryListView, PDFReportView, RegisterView
+from .views import (FileUploadView, BatchUploadView, BatchStatusView, AppendUploadView, IngestionJobView,
+                    DashboardDataView, EquipmentListView, EquipmentExportView, TopEquipmentChartView,
+                    HistogramChartView, TypeSummaryChartView, CriticalEquipmentView, UploadComparisonView,
+                    HistoryListView, PDFReportView, RegisterView)
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', obtain_auth_token, name='login'), 
     
     path('upload/', FileUploadView.as_view(), name='file-upload'),
+    path('upload/batch/', BatchUploadView.as_view(), name='upload-batch'),
+    path('upload/batch/<uuid:batch_id>/', BatchStatusView.as_view(), name='upload-batch-status'),
+    path('jobs/<uuid:pk>/', IngestionJobView.as_view(), name='ingestion-job'),
     path('dashboard/', DashboardDataView.as_view(), name='dashboard-data'),
+    path('uploads/compare/', UploadComparisonView.as_view(), name='upload-compare'),
+    path('uploads/<int:upload_id>/append/', AppendUploadView.as_view(), name='upload-append'),
+    path('uploads/<int:upload_id>/equipment/', EquipmentListView.as_view(), name='upload-equipment'),
+    path('uploads/<int:upload_id>/export/<str:file_format>/', EquipmentExportView.as_view(), name='upload-export'),
+    path('uploads/<int:upload_id>/charts/top/', TopEquipmentChartView.as_view(), name='chart-top'),
+    path('uploads/<int:upload_id>/charts/histogram/', HistogramChartView.as_view(), name='chart-histogram'),
+    path('uploads/<int:upload_id>/charts/types/', TypeSummaryChartView.as_view(), name='chart-types'),
+    path('uploads/<int:upload_id>/critical/', CriticalEquipmentView.as_view(), name='upload-critical'),
     path('history/', HistoryListView.as_view(), name='history-list'),
     path('report/pdf/', PDFReportView.as_view(), name='pdf-report'),
 ]
\ No newline at end of file
@@ -1,15 +1,30 @@
+import math
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import FileUploadParser, MultiPartParser
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count
-from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 
-from .models import UploadHistory, Equipment
-from .serializers import UploadHistorySerializer, EquipmentSerializer, UserSerializer
-from .services import process_csv_file, generate_pdf_report
+from .caching import ConditionalUploadCacheMixin
+from .charts import critical_equipment, metric_histogram, top_equipment, type_summaries
+from .comparison import compare_uploads
+from .exports import EXPORT_FORMATS, pa, stream_export
+from .jobs import get_live_progress, submit_batch_ingestion, submit_ingestion
+from .models import UploadHistory, Equipment, IngestionJob
+from .pagination import EquipmentCursorPagination
+from .ranges import ranged_file_response
+from .serializers import (UploadHistorySerializer, UserSerializer, IngestionJobSerializer,
+                          EquipmentRowSerializer, UploadHistoryRowSerializer)
+from .services import EQUIPMENT_FIELDS, METRIC_FIELDS, get_report_path, get_upload_aggregate, report_etag
+from .upload_handlers import SpoolingUploadHandler
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -17,65 +32,326 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = UserSerializer
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        user = User.objects.get(username=response.data['username'])
-        token, created = Token.objects.get_or_create(user=user)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.save()
+        # A brand-new user cannot have a token yet, so skip get_or_create's lookup
+        token = Token.objects.create(user=user)
         return Response({'token': token.key, 'user_id': user.id, 'username': user.username}, status=status.HTTP_201_CREATED)
 
 class FileUploadView(APIView):
     permission_classes = [IsAuthenticated]
+    # A multipart form, or the raw CSV (optionally Content-Encoding: gzip) as the body
+    parser_classes = [MultiPartParser, FileUploadParser]
 
     def post(self, request, *args, **kwargs):
+        # Must be installed before the body is parsed
+        request.upload_handlers = [SpoolingUploadHandler(request)]
         file_obj = request.FILES.get('file')
         if not file_obj:
             return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            history_record = process_csv_file(file_obj, request.user)
-            serializer = UploadHistorySerializer(history_record)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            job = submit_ingestion(file_obj, request.user)
+            return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({"error": "Internal Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class DashboardDataView(APIView):
+class AppendUploadView(APIView):
+    """Queues a CSV whose rows are appended to one of the user's uploads."""
     permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FileUploadParser]
 
-    def get(self, request, *args, **kwargs):
-        latest_upload = UploadHistory.objects.filter(user=request.user).order_by('-uploaded_at').first()
-        
-        if not latest_upload:
-            return Response({"message": "No data available"}, status=status.HTTP_204_NO_CONTENT)
+    def post(self, request, upload_id, *args, **kwargs):
+        upload = get_object_or_404(UploadHistory, pk=upload_id, user=request.user)
+        request.upload_handlers = [SpoolingUploadHandler(request)]
+        file_obj = request.FILES.get('file')
+        if not file_obj:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        summary_serializer = UploadHistorySerializer(latest_upload)
-        equipment_qs = latest_upload.equipments.all()
-        equipment_serializer = EquipmentSerializer(equipment_qs, many=True)
-        type_distribution = equipment_qs.values('type').annotate(count=Count('type'))
+        job = submit_ingestion(file_obj, request.user, append_to=upload)
+        return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class BatchUploadView(APIView):
+    """
+    Queues several CSVs (repeated `files` form fields) in one request. They
+    are parsed in parallel and committed in the order sent; each file gets
+    its own job, listed in the response and at the batch's status URL.
+    """
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request, *args, **kwargs):
+        request.upload_handlers = [SpoolingUploadHandler(request)]
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({"error": "No files provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        batch_id, jobs = submit_batch_ingestion(files, request.user)
+        return Response({'batch': batch_id, 'jobs': IngestionJobSerializer(jobs, many=True).data},
+                        status=status.HTTP_202_ACCEPTED)
+
+class BatchStatusView(APIView):
+    """Per-file results of a batch upload; `status` is `completed` once every file has settled."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, batch_id, *args, **kwargs):
+        jobs = list(IngestionJob.objects.filter(user=request.user, batch_id=batch_id)
+                    .select_related('upload').order_by('created_at'))
+        if not jobs:
+            return Response({"error": "Batch not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        counts = {state: sum(job.status == state for job in jobs) for state, _ in IngestionJob.STATUS_CHOICES}
+        settled = counts[IngestionJob.STATUS_COMPLETED] + counts[IngestionJob.STATUS_FAILED]
         return Response({
-            "summary": summary_serializer.data,
-            "distribution": type_distribution,
-            "equipment_list": equipment_serializer.data
+            'batch': batch_id,
+            'status': IngestionJob.STATUS_COMPLETED if settled == len(jobs) else IngestionJob.STATUS_RUNNING,
+            'counts': counts,
+            'jobs': IngestionJobSerializer(jobs, many=True).data,
         })
 
-class HistoryListView(generics.ListAPIView):
+class IngestionJobView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = IngestionJobSerializer
+
+    def get_queryset(self):
+        return IngestionJob.objects.filter(user=self.request.user).select_related('upload')
+
+    def get_object(self):
+        job = super().get_object()
+        if job.status == IngestionJob.STATUS_RUNNING:
+            live = get_live_progress(job.id)
+            if live:
+                job.processed_rows, job.total_rows = live
+        return job
+
+class DashboardDataView(ConditionalUploadCacheMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    cache_name = 'dashboard'
+
+    def build_payload(self, request, latest):
+        if not latest:
+            return None
+
+        latest_upload = UploadHistory.objects.with_aggregates().get(pk=latest['id'])
+        summary_serializer = UploadHistorySerializer(latest_upload)
+        aggregate = get_upload_aggregate(latest_upload)
+
+        return {
+            "summary": summary_serializer.data,
+            "distribution": aggregate.type_distribution,
+            "statistics": aggregate.metric_stats,
+        }
+
+    def render_payload(self, payload):
+        if payload is None:
+            return Response({"message": "No data available"}, status=status.HTTP_204_NO_CONTENT)
+        return Response(payload)
+
+class EquipmentListView(generics.ListAPIView):
+    """
+    Cursor-paginated equipment rows of one upload. `?fields=name,pressure`
+    limits the columns returned.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = EquipmentCursorPagination
+
+    def get_fields(self):
+        param = self.request.query_params.get('fields')
+        if not param:
+            return list(EQUIPMENT_FIELDS)
+        fields = [f.strip() for f in param.split(',') if f.strip()]
+        unknown = set(fields) - set(EQUIPMENT_FIELDS)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_queryset(self):
+        upload = get_object_or_404(UploadHistory, pk=self.kwargs['upload_id'], user=self.request.user)
+        return Equipment.objects.filter(upload_id=upload.dataset_id)
+
+    def list(self, request, *args, **kwargs):
+        serializer = EquipmentRowSerializer(self.get_fields())
+        ordering = self.paginator.get_ordering(request, None, self)
+        # The paginator reads its position from the sort keys, so fetch them too
+        keys = tuple(o.lstrip('-') for o in ordering if o.lstrip('-') not in serializer.fields)
+        self.paginator.row_fields = serializer.fields + keys
+        page = self.paginate_queryset(serializer.values_list(self.get_queryset(), *keys))
+        return self.get_paginated_response(serializer.to_representation(page))
+
+class EquipmentExportView(APIView):
+    """Streams an upload's equipment columns as Arrow IPC (`arrow`) or Parquet (`parquet`)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id, file_format, *args, **kwargs):
+        if file_format not in EXPORT_FORMATS:
+            return Response({"error": f"Unsupported format: {file_format}"}, status=status.HTTP_400_BAD_REQUEST)
+        if pa is None:
+            return Response({"error": "Columnar export requires pyarrow"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        upload = get_object_or_404(UploadHistory, pk=upload_id, user=request.user)
+        content_type, extension = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(stream_export(upload.dataset_id, file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="upload_{upload.id}.{extension}"'
+        return response
+
+class UploadChartView(APIView):
+    """
+    Base for the chart data endpoints: small, pre-reduced payloads computed
+    in the database so clients never download rows just to draw a chart.
+    """
+    permission_classes = [IsAuthenticated]
+
+    queryset = UploadHistory.objects.all()
+
+    def get_upload(self):
+        return get_object_or_404(self.queryset, pk=self.kwargs['upload_id'], user=self.request.user)
+
+    def get_metric(self):
+        metric = self.request.query_params.get('metric', 'pressure')
+        if metric not in METRIC_FIELDS:
+            raise ValidationError({'metric': f"Must be one of: {', '.join(METRIC_FIELDS)}"})
+        return metric
+
+    def get_int_param(self, name, default, maximum):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: "Must be an integer"})
+        if not 1 <= value <= maximum:
+            raise ValidationError({name: f"Must be between 1 and {maximum}"})
+        return value
+
+class TopEquipmentChartView(UploadChartView):
+    """`?metric=pressure&limit=5&order=desc` -> the extreme rows of one metric."""
+
+    def get(self, request, *args, **kwargs):
+        metric = self.get_metric()
+        limit = self.get_int_param('limit', 5, 100)
+        order = request.query_params.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            raise ValidationError({'order': "Must be 'asc' or 'desc'"})
+
+        rows = top_equipment(self.get_upload().dataset_id, metric, limit, descending=order == 'desc')
+        return Response({'metric': metric, 'results': rows})
+
+class HistogramChartView(UploadChartView):
+    """`?metric=pressure&bins=20[&min=..&max=..]`; the range defaults to the metric's min/max."""
+    queryset = UploadHistory.objects.with_aggregates()
+
+    def get(self, request, *args, **kwargs):
+        metric = self.get_metric()
+        bins = self.get_int_param('bins', 20, 200)
+        upload = self.get_upload()
+
+        stats = {}
+        if 'min' not in request.query_params or 'max' not in request.query_params:
+            stats = get_upload_aggregate(upload).metric_stats.get(metric) or {}
+        try:
+            low = float(request.query_params.get('min', stats.get('min')))
+            high = float(request.query_params.get('max', stats.get('max')))
+        except TypeError:
+            # No rows, so no range to bin over
+            return Response({'metric': metric, 'edges': [], 'counts': []})
+        except ValueError:
+            raise ValidationError({'range': "min and max must be numbers"})
+        if not (math.isfinite(low) and math.isfinite(high)):
+            raise ValidationError({'range': "min and max must be finite"})
+        if not low <= high:
+            raise ValidationError({'range': "min must not exceed max"})
+
+        return Response(metric_histogram(upload.dataset_id, metric, bins, low, high))
+
+class TypeSummaryChartView(UploadChartView):
+    """Per-type row counts and mean/min/max of every metric."""
+
+    def get(self, request, *args, **kwargs):
+        return Response(type_summaries(self.get_upload().dataset_id))
+
+class CriticalEquipmentView(UploadChartView):
+    """
+    `?metric=pressure&limit=50` -> the rows flagged at ingest for breaching
+    an operating limit or as z-score outliers, with per-metric counts.
+    Without `metric`, rows flagged for any metric are listed.
+    """
+
+    def get(self, request, *args, **kwargs):
+        metric = self.get_metric() if 'metric' in request.query_params else None
+        limit = self.get_int_param('limit', 50, 1000)
+        return Response(critical_equipment(self.get_upload().dataset_id, metric, limit))
+
+class UploadComparisonView(UploadChartView):
+    """
+    `?ids=3,5,8[&metric=pressure&limit=10]` -> every listed upload compared
+    against the first: aggregate, per-type and equipment_id-matched deltas,
+    with the `limit` largest changes of `metric`.
+    """
+    queryset = UploadHistory.objects.with_aggregates()
+    MAX_UPLOADS = 10
+
+    def get(self, request, *args, **kwargs):
+        try:
+            ids = list(dict.fromkeys(int(i) for i in request.query_params.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            raise ValidationError({'ids': "Must be a comma-separated list of upload ids"})
+        if not 2 <= len(ids) <= self.MAX_UPLOADS:
+            raise ValidationError({'ids': f"Between 2 and {self.MAX_UPLOADS} upload ids are required"})
+        metric = self.get_metric()
+        limit = self.get_int_param('limit', 10, 100)
+
+        uploads = self.queryset.filter(user=request.user).in_bulk(ids)
+        if len(uploads) != len(ids):
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        uploads = [uploads[i] for i in ids]
+
+        payload = compare_uploads(uploads, metric, limit)
+        payload['uploads'] = UploadHistorySerializer(uploads, many=True).data
+        return Response(payload)
+
+class HistoryListView(ConditionalUploadCacheMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UploadHistorySerializer
+    cache_name = 'history'
 
     def get_queryset(self):
-        return UploadHistory.objects.filter(user=self.request.user).order_by('-uploaded_at')[:5]
+        # Pruning runs in the background, so expired uploads may briefly linger
+        return UploadHistory.objects.filter(user=self.request.user).order_by('-uploaded_at')[:settings.UPLOAD_RETENTION]
+
+    def build_payload(self, request, latest):
+        serializer = UploadHistoryRowSerializer()
+        return serializer.to_representation(serializer.values_list(self.get_queryset()))
+
+    def render_payload(self, payload):
+        return Response(payload)
 
 class PDFReportView(APIView):
+    """
+    The latest upload's report, rendered once into the on-disk report cache.
+    Its ETag comes from the rendered file, not the upload state: ReportLab
+    output differs between renders, so If-None-Match and an If-Range resume
+    must never match bytes of a different render.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        latest = UploadHistory.objects.filter(user=request.user).order_by('-uploaded_at').first()
+        # Loaded in full, so a first render needs no second lookup
+        latest = UploadHistory.objects.with_aggregates().filter(user=request.user).order_by('-uploaded_at').first()
         if not latest:
             return Response({"error": "No data found"}, status=404)
-            
-        pdf_buffer = generate_pdf_report(latest.id)
-        
-        response = HttpResponse(pdf_buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="report_{latest.id}.pdf"'
-        return response
\ No newline at end of file
+        path = get_report_path(latest)
+
+        # Opened once, so the validator and the bytes sent describe the same file
+        # even if a concurrent render replaces it meanwhile
+        f = open(path, 'rb')
+        etag = report_etag(f)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            f.close()
+            not_modified['ETag'] = etag
+            return not_modified
+
+        # Range requests let the desktop client resume an interrupted download
+        response = ranged_file_response(request, f, etag,
+                                        filename=f"report_{latest.id}.pdf", content_type='application/pdf')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
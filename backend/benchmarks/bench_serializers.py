@@ -0,0 +1,60 @@
+"""
+Compares the DRF ModelSerializer path against the values_list fast path
+for equipment rows.
+
+    cd backend && python -m benchmarks.bench_serializers --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+
+from .common import best_of, setup_django
+from .generate_csv import generate_frame
+
+def make_columns(n, seed=0):
+    """Synthetic rows normalized exactly as process_csv_file would store them."""
+    from api.parsing import normalize_frame
+    frame = generate_frame(n, seed)
+    frame.columns = [c.strip().lower().replace(' ', '_') for c in frame.columns]
+    return normalize_frame(frame)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    db_path = setup_django()
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from api.models import UploadHistory, Equipment
+    from api.renderers import FastJSONRenderer, orjson
+    from api.serializers import EquipmentSerializer, EquipmentRowSerializer
+    from api.services import _bulk_insert_equipment
+
+    user = User.objects.create_user(username='bench')
+    print(f"encoder: {'orjson' if orjson else 'stdlib json'}")
+    print(f"{'rows':>10} {'drf (s)':>10} {'fast (s)':>10} {'speedup':>8}")
+
+    try:
+        for size in args.sizes:
+            history = UploadHistory.objects.create(user=user, file_name=f"bench-{size}.csv", total_records=size)
+            _bulk_insert_equipment(history.id, make_columns(size), settings.INGEST_BATCH_SIZE)
+            queryset = Equipment.objects.filter(upload=history).order_by('id')
+
+            def drf_path():
+                JSONRenderer().render(EquipmentSerializer(queryset, many=True).data)
+
+            def fast_path():
+                serializer = EquipmentRowSerializer()
+                FastJSONRenderer().render(serializer.to_representation(serializer.values_list(queryset)))
+
+            drf = best_of(drf_path, args.repeat)
+            fast = best_of(fast_path, args.repeat)
+            print(f"{size:>10} {drf:>10.3f} {fast:>10.3f} {drf / fast:>7.1f}x")
+    finally:
+        os.remove(db_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Shared setup for the standalone benchmark scripts (run from backend/)."""
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def setup_django(db_path=None):
+    """Configures Django against a scratch SQLite database and migrates it."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(prefix='cev-bench-', suffix='.sqlite3')
+        os.close(fd)
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+def best_of(func, repeat):
+    """Runs func `repeat` times and returns the fastest wall time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
@@ -0,0 +1,51 @@
+"""
+Compares two benchmark result files and flags regressions.
+
+    cd backend && python -m benchmarks.compare baseline.json candidate.json --threshold 0.2
+
+Exits with status 1 when any case got slower than the threshold allows or
+issues more queries than before.
+"""
+import argparse
+import json
+import sys
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {(r['case'], r['rows']): r for r in report['results']}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Allowed relative latency increase before flagging (default 0.2 = 20%%)")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help="Ignore latency changes smaller than this, which are mostly timer noise")
+    args = parser.parse_args()
+
+    base_report, base = load(args.baseline)
+    cand_report, cand = load(args.candidate)
+    print(f"baseline {base_report['commit']}  ->  candidate {cand_report['commit']}")
+    print(f"{'case':>10} {'rows':>9} {'base ms':>10} {'cand ms':>10} {'change':>8} {'queries':>9}  status")
+
+    regressions = 0
+    for key in sorted(base.keys() & cand.keys(), key=lambda k: (k[1], k[0])):
+        old, new = base[key], cand[key]
+        change = new['latency_s'] / old['latency_s'] - 1 if old['latency_s'] else 0.0
+        delta_ms = (new['latency_s'] - old['latency_s']) * 1000
+        slower = change > args.threshold and delta_ms > args.min_delta_ms
+        more_queries = new['queries'] > old['queries']
+        status = 'REGRESSION' if slower or more_queries else 'ok'
+        regressions += status != 'ok'
+        print(f"{key[0]:>10} {key[1]:>9} {old['latency_s'] * 1000:10.1f} {new['latency_s'] * 1000:10.1f} "
+              f"{change:+7.1%} {old['queries']:>4}->{new['queries']:<4}  {status}")
+
+    for key in sorted(base.keys() ^ cand.keys()):
+        print(f"{key[0]:>10} {key[1]:>9}  only in {'baseline' if key in base else 'candidate'}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Synthetic equipment CSV generator for benchmarks.
+
+    cd backend && python -m benchmarks.generate_csv --rows 100000 --out /tmp/plant.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# type: (share of fleet, id prefix, flowrate median, pressure mean/sd, temperature mean/sd)
+EQUIPMENT_PROFILES = {
+    'Pump': (0.30, 'P', 120.0, (5.5, 0.8), (95.0, 10.0)),
+    'Valve': (0.25, 'V', 80.0, (4.0, 0.6), (85.0, 8.0)),
+    'Compressor': (0.15, 'C', 200.0, (8.5, 1.2), (130.0, 15.0)),
+    'HeatExchanger': (0.15, 'HX', 150.0, (6.0, 0.9), (140.0, 20.0)),
+    'Reactor': (0.10, 'R', 90.0, (7.5, 1.5), (180.0, 25.0)),
+    'Condenser': (0.05, 'CD', 110.0, (3.5, 0.5), (60.0, 6.0)),
+}
+OUTLIER_RATE = 0.002
+CHUNK_ROWS = 100_000
+
+def generate_frame(rows, seed=0, start=0):
+    """Returns `rows` synthetic equipment records in the CSV's column layout."""
+    rng = np.random.default_rng(seed)
+    names = list(EQUIPMENT_PROFILES)
+    shares = np.array([EQUIPMENT_PROFILES[t][0] for t in names])
+    type_idx = rng.choice(len(names), size=rows, p=shares / shares.sum())
+
+    prefixes = np.array([EQUIPMENT_PROFILES[t][1] for t in names], dtype=object)
+    flow_median = np.array([EQUIPMENT_PROFILES[t][2] for t in names])
+    p_mean, p_sd = np.array([EQUIPMENT_PROFILES[t][3] for t in names]).T
+    t_mean, t_sd = np.array([EQUIPMENT_PROFILES[t][4] for t in names]).T
+
+    serial = np.arange(start, start + rows)
+    flowrate = flow_median[type_idx] * rng.lognormal(0.0, 0.25, rows)
+    pressure = rng.normal(p_mean[type_idx], p_sd[type_idx])
+    temperature = rng.normal(t_mean[type_idx], t_sd[type_idx])
+
+    # A few faulty readings so outlier and top-N paths have something to find
+    outliers = rng.random(rows) < OUTLIER_RATE
+    pressure[outliers] *= rng.uniform(1.8, 2.5, outliers.sum())
+    temperature[outliers] += rng.uniform(40, 80, outliers.sum())
+
+    ids = pd.Series(prefixes[type_idx]) + '-' + pd.Series(serial + 1000).astype(str)
+    return pd.DataFrame({
+        'Equipment ID': ids,
+        'Equipment Name': pd.Series(np.array(names, dtype=object)[type_idx]) + ' ' + pd.Series(serial).astype(str),
+        'Type': np.array(names, dtype=object)[type_idx],
+        'Flowrate': flowrate.round(2),
+        'Pressure': pressure.clip(min=0).round(2),
+        'Temperature': temperature.round(1),
+    })
+
+def write_csv(path, rows, seed=0):
+    """Writes the CSV in chunks so memory stays flat for large row counts."""
+    for chunk, start in enumerate(range(0, rows, CHUNK_ROWS)):
+        frame = generate_frame(min(CHUNK_ROWS, rows - start), seed=seed + chunk, start=start)
+        frame.to_csv(path, mode='w' if chunk == 0 else 'a', header=chunk == 0, index=False)
+    if rows == 0:
+        generate_frame(0).to_csv(path, index=False)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.out, args.rows, args.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Backend benchmark suite: times ingest, dashboard, history and PDF paths
+(and re-uploading an already ingested file) against synthetic CSVs and stores latency, peak RSS and query counts as JSON.
+
+    cd backend && python -m benchmarks.run --sizes 1000 100000 1000000
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+Every (size, case) pair runs in a fresh process so peak RSS is per case.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+from .common import BACKEND_DIR, setup_django
+from .generate_csv import write_csv
+
+CASES = ('ingest', 'dashboard', 'history', 'pdf', 'dedup')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _case_runner(case, csv_path):
+    """Returns a zero-argument callable that exercises one benchmark case."""
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from api.models import UploadHistory
+    from api.services import generate_pdf_report, process_csv_file
+    from api.views import DashboardDataView, HistoryListView
+
+    if case == 'ingest':
+        # A new user per run, so content-hash dedup cannot short-circuit repeats
+        runs = itertools.count()
+
+        def run():
+            user = User.objects.create(username=f"bench-{next(runs)}")
+            with open(csv_path, 'rb') as f:
+                process_csv_file(f, user, file_name=os.path.basename(csv_path))
+        return run
+
+    latest = UploadHistory.objects.select_related('user').latest('uploaded_at')
+    user = latest.user
+    if case == 'dedup':
+        def run():
+            with open(csv_path, 'rb') as f:
+                process_csv_file(f, user, file_name=os.path.basename(csv_path))
+        return run
+
+    if case == 'pdf':
+        return lambda: generate_pdf_report(UploadHistory.objects.with_aggregates().get(pk=latest.pk))
+
+    view, path = {
+        'dashboard': (DashboardDataView.as_view(), '/api/dashboard/'),
+        'history': (HistoryListView.as_view(), '/api/history/'),
+    }[case]
+    factory = APIRequestFactory()
+
+    def run():
+        # Measure the uncached path; a warm response cache would hide the work
+        cache.clear()
+        request = factory.get(path)
+        force_authenticate(request, user=user)
+        view(request).render()
+    return run
+
+def measure(case, rows, csv_path, db_path, repeat):
+    """Child-process entry point: times one case and reports its resource use."""
+    setup_django(db_path)
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    run = _case_runner(case, csv_path)
+    baseline_rss = peak_rss_mb()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    peak = peak_rss_mb()
+
+    with CaptureQueriesContext(connection) as queries:
+        run()
+
+    return {
+        'case': case,
+        'rows': rows,
+        'latency_s': statistics.median(timings),
+        'min_s': min(timings),
+        'repeat': repeat,
+        'peak_rss_mb': peak,
+        'rss_growth_mb': None if peak is None else peak - baseline_rss,
+        'queries': len(queries),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file to write (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [],
+    }
+
+    # Ingest always runs first: the other cases read the upload it creates
+    cases = ['ingest'] + [c for c in args.cases if c != 'ingest']
+    with tempfile.TemporaryDirectory(prefix='cev-bench-') as workdir:
+        for rows in args.sizes:
+            csv_path = write_csv(os.path.join(workdir, f"equipment-{rows}.csv"), rows, args.seed)
+            db_path = os.path.join(workdir, f"bench-{rows}.sqlite3")
+            for case in cases:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    result = pool.submit(measure, case, rows, csv_path, db_path, args.repeat).result()
+                if case in args.cases:
+                    report['results'].append(result)
+                    print(f"{case:>10} {rows:>9} rows  {result['latency_s'] * 1000:10.1f} ms  "
+                          f"{result['peak_rss_mb'] or 0:8.1f} MB  {result['queries']:4d} queries")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryStatsMiddleware',
+    'api.middleware.JSONGZipMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -43,6 +46,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated', 
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 ROOT_URLCONF = 'config.urls'
@@ -97,3 +104,73 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+# Rows written per INSERT batch during CSV ingestion
+INGEST_BATCH_SIZE = 5000
+
+# Uploads kept per user; older ones are pruned in the background after each upload
+UPLOAD_RETENTION = 5
+
+# Background ingestion worker pool
+INGEST_WORKERS = 2
+INGEST_SPOOL_DIR = BASE_DIR / 'ingest_spool'
+# Largest a gzip upload may grow to once inflated; larger ones are rejected with 413
+MAX_INFLATED_UPLOAD_SIZE = 1024 * 2 ** 20
+# Processes parsing the files of a batch upload in parallel
+INGEST_PROCESSES = min(4, os.cpu_count() or 1)
+
+# Rows sampled per upload for percentile aggregates (exact up to this many rows).
+# The sample is stored with each aggregate so appends can merge into it.
+AGGREGATE_SAMPLE_SIZE = 20000
+
+# Critical-condition flags computed at ingest (api.flags). A row is flagged when
+# a metric is outside its absolute (low, high) operating limits (None leaves a
+# side open), or more than CRITICAL_ZSCORE standard deviations from its upload's mean.
+# Limit changes apply to rows ingested afterwards.
+CRITICAL_LIMITS = {
+    'flowrate': (None, None),
+    'pressure': (None, 7.5),
+    'temperature': (None, 130.0),
+}
+CRITICAL_ZSCORE = 3.0
+
+# Per-user dashboard/history/report responses (default local-memory cache)
+RESPONSE_CACHE_TIMEOUT = 600
+
+# Rendered PDF reports, keyed by upload id, report version and when the upload last changed
+REPORT_CACHE_DIR = BASE_DIR / 'report_cache'
+# Columnar (Arrow IPC) copies of datasets read by upload comparisons; needs pyarrow
+SNAPSHOT_CACHE_DIR = BASE_DIR / 'snapshot_cache'
+
+# JSON responses smaller than this are sent uncompressed (api.middleware.JSONGZipMiddleware)
+GZIP_MIN_BYTES = 1024
+
+# Per-request SQL instrumentation (api.middleware.QueryStatsMiddleware)
+QUERY_STATS_HEADERS = DEBUG
+QUERY_STATS_SLOWEST = 3
+QUERY_STATS_SLOW_MS = 100
+# Max queries per endpoint, keyed by URL name, as measured by api.tests. Token auth
+# costs one query; BEGIN counts, COMMIT does not (it never goes through a cursor).
+QUERY_BUDGETS = {
+    'register': 3,
+    # A user's first login creates their token in a transaction
+    'login': 4,
+    'file-upload': 2,
+    'upload-append': 3,
+    'upload-batch': 3,
+    'upload-batch-status': 2,
+    'ingestion-job': 2,
+    'dashboard-data': 3,
+    'upload-equipment': 3,
+    'upload-export': 2,
+    'chart-top': 3,
+    'chart-histogram': 3,
+    'chart-types': 3,
+    'upload-critical': 4,
+    # Two, plus one scan per dataset without a snapshot (at most UPLOAD_RETENTION of them)
+    'upload-compare': 7,
+    'history-list': 3,
+    'pdf-report': 3,
+}
+# Raise instead of logging when a budget is exceeded (api.tests and CI turn it on)
+QUERY_BUDGET_STRICT = False
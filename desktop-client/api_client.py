@@ -1,14 +1,122 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import quote, urlencode
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for export_dataset()
+    pa = pq = None
+
+from response_cache import ResponseCache
 
 BASE_URL = "http://127.0.0.1:8000/api"
 
+# (connect, read) timeouts in seconds; file transfers get a longer read timeout
+TIMEOUT = (3.05, 30)
+TRANSFER_TIMEOUT = (3.05, 300)
+# Idempotent requests are retried on connection errors and gateway errors,
+# waiting 0.5s, 1s, 2s ... between attempts
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 10
+# Uploads are gzip-compressed before sending; CSV exports typically shrink 5-10x
+UPLOAD_COMPRESSLEVEL = 6
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Returns the process-wide HTTP session, creating it on first use. All
+    worker threads share its keep-alive connection pool; per-request state
+    (auth header, timeout) is passed on each call, never stored on it.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({'GET', 'HEAD'}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _session = session
+        return _session
+
+def configure(timeout=None, transfer_timeout=None, retries=None, pool_size=None):
+    """Overrides the HTTP defaults above; the session is rebuilt on next use."""
+    global TIMEOUT, TRANSFER_TIMEOUT, RETRIES, POOL_SIZE, _session
+    with _session_lock:
+        TIMEOUT = timeout or TIMEOUT
+        TRANSFER_TIMEOUT = transfer_timeout or TRANSFER_TIMEOUT
+        RETRIES = RETRIES if retries is None else retries
+        POOL_SIZE = pool_size or POOL_SIZE
+        if _session is not None:
+            _session.close()
+            _session = None
+
+class _UploadBody:
+    """
+    File-like request body read by the HTTP client in chunks. Its length
+    sets Content-Length (Django needs it; chunked bodies are not read) and
+    every read reports progress(sent, total).
+    """
+
+    def __init__(self, f, progress=None):
+        self.f = f
+        self.total = os.fstat(f.fileno()).st_size
+        self.sent = 0
+        self.progress = progress
+        self._reported = 0
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size=-1):
+        chunk = self.f.read(UPLOAD_CHUNK_SIZE if size is None or size < 0 else size)
+        self.sent += len(chunk)
+        # At most ~200 reports per upload, whatever the HTTP client's block size
+        if self.progress and (self.sent - self._reported >= self.total / 200 or self.sent == self.total):
+            self._reported = self.sent
+            self.progress(self.sent, self.total)
+        return chunk
+
 class APIClient:
     TOKEN = None # Stores the session token
+    CACHE = None # ResponseCache of the signed-in user
+    OFFLINE = False # Set while the server cannot be reached
 
     @classmethod
     def set_token(cls, token):
         cls.TOKEN = token
 
+    @classmethod
+    def use_cache(cls, username):
+        """Selects the on-disk response cache of `username` on this server."""
+        cls.CACHE = ResponseCache(BASE_URL, username)
+
+    @classmethod
+    def cached(cls, name):
+        """Data of a cache entry without contacting the server, or None."""
+        entry = cls.CACHE.load(name) if cls.CACHE else None
+        return entry['data'] if entry else None
+
     @classmethod
     def get_headers(cls):
         """Helper to attach Auth header if token exists."""
@@ -16,11 +124,45 @@ class APIClient:
             return {'Authorization': f'Token {cls.TOKEN}'}
         return {}
 
+    @classmethod
+    def request(cls, method, url, timeout=None, **kwargs):
+        """Sends a request through the shared session with auth and a timeout."""
+        headers = {**cls.get_headers(), **kwargs.pop('headers', {})}
+        try:
+            response = get_session().request(method, url, headers=headers, timeout=timeout or TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            cls.OFFLINE = True
+            raise
+        cls.OFFLINE = False
+        return response
+
+    @classmethod
+    def fetch_cached(cls, name, path):
+        """
+        GETs `path` revalidated against cache entry `name`: the cached ETag
+        is sent as If-None-Match and a 304 is answered from disk. Returns
+        (data, fresh); when the server is unreachable or refuses, the cached
+        data (or None) comes back with fresh=False.
+        """
+        entry = cls.CACHE.load(name) if cls.CACHE else None
+        headers = {'If-None-Match': entry['etag']} if entry and entry['etag'] else {}
+        try:
+            response = cls.request('GET', f"{BASE_URL}{path}", headers=headers)
+        except Exception:
+            response = None
+
+        if response is not None and response.status_code in (200, 204):
+            data = response.json() if response.status_code == 200 else None
+            if cls.CACHE:
+                cls.CACHE.store(name, response.headers.get('ETag'), data)
+            return data, True
+        return (entry['data'] if entry else None), False
+
     @staticmethod
     def login(username, password):
         try:
             payload = {'username': username, 'password': password}
-            response = requests.post(f"{BASE_URL}/login/", json=payload)
+            response = APIClient.request('POST', f"{BASE_URL}/login/", json=payload)
             if response.status_code == 200:
                 return response.json() 
             return None
@@ -30,49 +172,244 @@ class APIClient:
 
     @staticmethod
     def get_dashboard_data():
+        data, _ = APIClient.fetch_cached('dashboard', '/dashboard/')
+        return data
+
+    @staticmethod
+    def equipment_page_url(upload_id, limit=500, ordering=None, fields=None):
+        """URL of the first cursor page of an upload's equipment rows; `ordering` is sorted on the server."""
+        params = {'limit': limit}
+        if ordering:
+            params['ordering'] = ordering
+        if fields:
+            params['fields'] = ','.join(fields)
+        return f"{BASE_URL}/uploads/{upload_id}/equipment/?{urlencode(params)}"
+
+    @staticmethod
+    def get_equipment_page(upload_id=None, limit=500, ordering=None, fields=None, next_url=None):
+        """
+        Fetches one cursor page of equipment rows. Pass the previous page's
+        `next` link as `next_url` to continue; it already carries the params.
+        """
         try:
-            response = requests.get(f"{BASE_URL}/dashboard/", headers=APIClient.get_headers())
+            url = next_url or APIClient.equipment_page_url(upload_id, limit, ordering, fields)
+            response = APIClient.request('GET', url)
             if response.status_code == 200:
                 return response.json()
-            elif response.status_code == 204:
-                return None
             return None
         except Exception:
             return None
 
     @staticmethod
-    def get_history():
-        """Fetches the last 5 uploads for the History Tab."""
+    def _get_chart(upload_id, chart, params=None):
+        try:
+            response = APIClient.request('GET', f"{BASE_URL}/uploads/{upload_id}/charts/{chart}/",
+                                         params=params)
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception:
+            return None
+
+    @staticmethod
+    def get_top_equipment(upload_id, metric='pressure', limit=5, ascending=False):
+        """Rows with the highest (or lowest) value of a metric, sorted by the server."""
+        params = {'metric': metric, 'limit': limit, 'order': 'asc' if ascending else 'desc'}
+        return APIClient._get_chart(upload_id, 'top', params)
+
+    @staticmethod
+    def get_critical_equipment(upload_id, metric=None, limit=50):
+        """
+        Rows flagged at ingest as breaching an operating limit or as outliers,
+        with per-metric counts. With a `metric`, only its flagged rows, highest first.
+        """
+        params = {'limit': limit}
+        if metric:
+            params['metric'] = metric
         try:
-            response = requests.get(f"{BASE_URL}/history/", headers=APIClient.get_headers())
+            response = APIClient.request('GET', f"{BASE_URL}/uploads/{upload_id}/critical/", params=params)
             if response.status_code == 200:
                 return response.json()
-            return []
+            return None
         except Exception:
-            return []
+            return None
+
+    @staticmethod
+    def get_histogram(upload_id, metric='pressure', bins=20):
+        """Fixed-bin histogram of a metric: {'edges': [...], 'counts': [...]}."""
+        return APIClient._get_chart(upload_id, 'histogram', {'metric': metric, 'bins': bins})
 
     @staticmethod
-    def upload_file(file_path):
+    def get_type_summary(upload_id):
+        """Per-type row counts and mean/min/max of every metric."""
+        return APIClient._get_chart(upload_id, 'types')
+
+    @staticmethod
+    def export_dataset(upload_id, file_format='arrow', as_numpy=False):
+        """
+        Downloads an upload's columns as Arrow IPC or Parquet and returns a
+        DataFrame, or a dict of NumPy arrays when `as_numpy` is set.
+        """
+        if pa is None:
+            print("Export Error: pyarrow is not installed")
+            return None
         try:
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(f"{BASE_URL}/upload/", files=files, headers=APIClient.get_headers())
+            response = APIClient.request('GET', f"{BASE_URL}/uploads/{upload_id}/export/{file_format}/",
+                                         timeout=TRANSFER_TIMEOUT)
+            if response.status_code != 200:
+                return None
+
+            if file_format == 'parquet':
+                table = pq.read_table(pa.BufferReader(response.content))
+            else:
+                table = pa.ipc.open_stream(response.content).read_all()
+
+            if as_numpy:
+                return {name: table.column(name).to_numpy() for name in table.column_names}
+            return table.to_pandas()
+        except Exception as e:
+            print(f"Export Error: {e}")
+            return None
+
+    @staticmethod
+    def get_history():
+        """Fetches the last 5 uploads for the History Tab."""
+        data, _ = APIClient.fetch_cached('history', '/history/')
+        return data or []
+
+    @staticmethod
+    def _compress(file_path):
+        """Gzips a file chunk by chunk into a temporary file and returns it, rewound."""
+        tmp = tempfile.TemporaryFile()
+        with open(file_path, 'rb') as src, gzip.GzipFile(fileobj=tmp, mode='wb',
+                                                         compresslevel=UPLOAD_COMPRESSLEVEL) as gz:
+            shutil.copyfileobj(src, gz, UPLOAD_CHUNK_SIZE)
+        tmp.seek(0)
+        return tmp
+
+    @staticmethod
+    def upload_file(file_path, progress=None, compress=True):
+        """
+        Submits a CSV for ingestion. On success returns (True, job dict).
+
+        The file is sent as the raw request body, gzip-compressed unless
+        `compress` is off or it already is a `.gz` file, and streamed in
+        chunks; progress(sent, total) reports the bytes on the wire.
+        """
+        name = os.path.basename(file_path)
+        already_gzip = name.lower().endswith('.gz')
+        headers = {'Content-Type': 'text/csv'}
+        try:
+            if already_gzip or compress:
+                headers['Content-Encoding'] = 'gzip'
+                name = name[:-3] if already_gzip else name
+            headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(name)}"
+
+            f = open(file_path, 'rb') if already_gzip or not compress else APIClient._compress(file_path)
+            with f:
+                response = APIClient.request('POST', f"{BASE_URL}/upload/", data=_UploadBody(f, progress),
+                                             headers=headers, timeout=TRANSFER_TIMEOUT)
             
-            if response.status_code == 201:
-                return True, "Upload Successful"
+            if response.status_code == 202:
+                return True, response.json()
             else:
                 return False, f"Failed: {response.text}"
         except Exception as e:
             return False, str(e)
 
     @staticmethod
-    def download_pdf(save_path):
+    def get_job(job_id):
+        """Fetches the status of a background ingestion job."""
+        try:
+            response = APIClient.request('GET', f"{BASE_URL}/jobs/{job_id}/")
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception:
+            return None
+
+    @staticmethod
+    def download_pdf(save_path, progress=None, is_cancelled=None):
+        """
+        Saves the report PDF, reporting progress(received, total) per chunk
+        (total is 0 while unknown) and stopping when is_cancelled() is true.
+
+        The download goes to the response cache first: an unchanged report
+        (304) or an unreachable server is served from the last complete
+        copy, and a download that was cancelled or cut off is resumed with
+        a Range request (If-Range guards against a report that changed).
+        """
+        cache = APIClient.CACHE
+        if cache is None:
+            return APIClient._download_pdf_direct(save_path)
+
+        for attempt in range(RETRIES + 1):
+            try:
+                result = APIClient._download_report(cache, progress, is_cancelled)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                # Includes a connection lost mid-transfer: resume from what arrived
+                if attempt == RETRIES or APIClient.OFFLINE:
+                    cached_path = cache.file_path('report')
+                    if cached_path and APIClient.OFFLINE:
+                        shutil.copyfile(cached_path, save_path)
+                        return True, "Offline: saved the last downloaded report"
+                    return False, str(e)
+                time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+            except Exception as e:
+                return False, str(e)
+
+        if result is None:
+            return False, "Download cancelled"
+        path, msg = result
+        shutil.copyfile(path, save_path)
+        return True, msg
+
+    @staticmethod
+    def _download_report(cache, progress, is_cancelled):
+        """One attempt of download_pdf(); returns (cached path, message) or None if cancelled."""
+        headers = {'Accept-Encoding': 'identity'}
+        cached_path = cache.file_path('report')
+        if cached_path:
+            etag = cache.load('report')['etag']
+            if etag:
+                headers['If-None-Match'] = etag
+        partial = cache.partial('report')
+        if partial and partial[1] and partial[2]:
+            headers['Range'] = f"bytes={partial[2]}-"
+            headers['If-Range'] = partial[1]
+
+        with APIClient.request('GET', f"{BASE_URL}/report/pdf/", stream=True, headers=headers,
+                               timeout=TRANSFER_TIMEOUT) as r:
+            if r.status_code == 304 and cached_path:
+                return cached_path, "Download Complete (unchanged)"
+            if r.status_code == 416 and partial:
+                # Nothing left to fetch: the partial file is already complete
+                return cache.complete_partial('report'), "Download Complete"
+            r.raise_for_status()
+
+            resume = r.status_code == 206
+            received = partial[2] if resume else 0
+            length = int(r.headers.get('Content-Length') or 0)
+            total = received + length if length else 0
+            with cache.open_partial('report', r.headers.get('ETag'), resume) as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    if is_cancelled and is_cancelled():
+                        return None
+                    f.write(chunk)
+                    received += len(chunk)
+                    if progress:
+                        progress(received, total)
+        return cache.complete_partial('report'), "Download Complete"
+
+    @staticmethod
+    def _download_pdf_direct(save_path):
         try:
-            with requests.get(f"{BASE_URL}/report/pdf/", stream=True, headers=APIClient.get_headers()) as r:
+            with APIClient.request('GET', f"{BASE_URL}/report/pdf/", stream=True, timeout=TRANSFER_TIMEOUT) as r:
                 r.raise_for_status()
                 with open(save_path, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
                         f.write(chunk)
             return True, "Download Complete"
         except Exception as e:
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
@@ -1,9 +1,16 @@
+import numpy as np
 import matplotlib
 matplotlib.use('Qt5Agg') # Force Qt5 Backend
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
 
+# Modern colors
+COLORS = ['#1E88E5', '#E53935', '#43A047', '#FB8C00', '#8E24AA']
+# Same geometry as Axes.pie's defaults
+LABEL_DISTANCE = 1.1
+PCT_DISTANCE = 0.6
+
 class MplCanvas(FigureCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100):
         self.fig = Figure(figsize=(width, height), dpi=dpi)
@@ -11,44 +18,102 @@ class MplCanvas(FigureCanvas):
         super(MplCanvas, self).__init__(self.fig)
 
 class DashboardCharts(QWidget):
-    def __init__(self, data):
-        super().__init__()
+    """
+    The Analytics tab's charts. The figure, its axes and their artists live
+    as long as the widget; set_data() changes wedge angles, bar heights and
+    labels in place and skips the redraw when the payload did not change.
+    Artists are only recreated (and the layout recomputed) when the number
+    of types or bars changes.
+    """
+
+    def __init__(self, data=None, parent=None):
+        super().__init__(parent)
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
-        
+
         # Create Canvas
         self.canvas = MplCanvas(self, width=10, height=8, dpi=100)
         layout.addWidget(self.canvas)
-        
-        self.plot_charts(data)
-
-    def plot_charts(self, data):
-        self.canvas.fig.clear()
-
-        # 1. Doughnut Chart (Distribution)
-        if 'distribution' in data and data['distribution']:
-            ax1 = self.canvas.fig.add_subplot(211)
-            types = [d['type'] for d in data['distribution']]
-            counts = [d['count'] for d in data['distribution']]
-            # Modern colors
-            colors = ['#1E88E5', '#E53935', '#43A047', '#FB8C00', '#8E24AA']
-            
-            ax1.pie(counts, labels=types, autopct='%1.1f%%', colors=colors, startangle=90, wedgeprops=dict(width=0.4))
-            ax1.set_title("Equipment Type Distribution", fontsize=10, fontweight='bold', pad=10)
-
-        # 2. Bar Chart (Top Pressures)
-        if 'equipment_list' in data and data['equipment_list']:
-            ax2 = self.canvas.fig.add_subplot(212)
-            # Sort top 5 by pressure
-            sorted_equip = sorted(data['equipment_list'], key=lambda x: x['pressure'], reverse=True)[:5]
-            
-            names = [d['name'] for d in sorted_equip]
-            pressures = [d['pressure'] for d in sorted_equip]
-            
-            ax2.bar(names, pressures, color='#3949AB', alpha=0.8)
-            ax2.set_ylabel("Pressure (bar)")
-            ax2.set_title("Critical Pressure Levels (Top 5)", fontsize=10, fontweight='bold', pad=10)
-            ax2.grid(True, axis='y', linestyle='--', alpha=0.3)
-
-        self.canvas.fig.tight_layout(pad=2.0)
-        self.canvas.draw()
\ No newline at end of file
+
+        fig = self.canvas.fig
+        self.ax_types = fig.add_subplot(211)
+        self.ax_top = fig.add_subplot(212)
+        self.ax_top.set_ylabel("Pressure (bar)")
+        self.ax_top.set_title("Critical Pressure Levels (Top 5)", fontsize=10, fontweight='bold', pad=10)
+        self.ax_top.grid(True, axis='y', linestyle='--', alpha=0.3)
+
+        self._wedges, self._labels, self._pcts = [], [], []
+        self._bars = None
+        self._key = None
+
+        if data:
+            self.set_data(data)
+
+    def set_data(self, data):
+        """Updates the charts from a dashboard payload. Returns False if nothing changed."""
+        distribution = data.get('distribution') or []
+        top = data.get('top_pressure') or []
+        key = (tuple((d['type'], d['count']) for d in distribution),
+               tuple((d['name'], d['pressure']) for d in top))
+        if key == self._key:
+            return False
+        self._key = key
+
+        relayout = self._set_distribution(distribution)
+        relayout = self._set_top_pressure(top) or relayout
+        if relayout:
+            self.canvas.fig.tight_layout(pad=2.0)
+        self.canvas.draw_idle()
+        return True
+
+    # 1. Doughnut Chart (Distribution)
+    def _set_distribution(self, distribution):
+        ax = self.ax_types
+        ax.set_visible(bool(distribution))
+        types = [d['type'] for d in distribution]
+        counts = [d['count'] for d in distribution]
+
+        if len(types) != len(self._wedges):
+            ax.clear()
+            self._wedges, self._labels, self._pcts = ([], [], []) if not types else ax.pie(
+                counts, labels=types, autopct='%1.1f%%', colors=COLORS, startangle=90, wedgeprops=dict(width=0.4))
+            ax.set_title("Equipment Type Distribution", fontsize=10, fontweight='bold', pad=10)
+            return True
+
+        # Same number of types: move the existing wedges and their labels
+        total = sum(counts)
+        theta = 90.0
+        for wedge, label, pct, name, count in zip(self._wedges, self._labels, self._pcts, types, counts):
+            span = 360.0 * count / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + span)
+            mid = np.deg2rad(theta + span / 2)
+            x, y = np.cos(mid), np.sin(mid)
+            label.set_position((LABEL_DISTANCE * x, LABEL_DISTANCE * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            label.set_text(name)
+            pct.set_position((PCT_DISTANCE * x, PCT_DISTANCE * y))
+            pct.set_text(f"{100.0 * count / total:.1f}%")
+            theta += span
+        return False
+
+    # 2. Bar Chart (Critical Pressures: flagged at ingest, highest first; hidden when none)
+    def _set_top_pressure(self, top):
+        ax = self.ax_top
+        ax.set_visible(bool(top))
+        names = [d['name'] for d in top]
+        pressures = [d['pressure'] for d in top]
+
+        relayout = self._bars is None or len(self._bars) != len(names)
+        if relayout:
+            if self._bars is not None:
+                self._bars.remove()
+            self._bars = ax.bar(range(len(names)), pressures, color='#3949AB', alpha=0.8)
+        else:
+            for bar, pressure in zip(self._bars, pressures):
+                bar.set_height(pressure)
+        # Positions rather than categorical names, so names never pile up on the axis
+        ax.set_xticks(range(len(names)), names)
+        ax.relim()
+        ax.autoscale_view()
+        return relayout
@@ -2,42 +2,18 @@ import sys
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QLabel, QHBoxLayout, QFrame, QPushButton, QFileDialog, 
-                             QMessageBox, QDialog, QStackedWidget, QTableWidget, 
-                             QTableWidgetItem, QScrollArea, QLineEdit, QSizePolicy)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+                             QMessageBox, QDialog, QStackedWidget, QTableView, 
+                             QHeaderView, QScrollArea, QLineEdit, QSizePolicy,
+                             QProgressDialog)
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFontDatabase 
 
 # Import Custom Modules
-from api_client import APIClient
+from api_client import APIClient, BASE_URL
 from charts import DashboardCharts 
-
-# --- WORKER THREADS ---
-class UploadWorker(QThread):
-    finished = pyqtSignal(bool, str)
-    def __init__(self, path):
-        super().__init__()
-        self.path = path
-    def run(self):
-        success, msg = APIClient.upload_file(self.path)
-        self.finished.emit(success, msg)
-
-class DataFetchWorker(QThread):
-    data_ready = pyqtSignal(dict)
-    history_ready = pyqtSignal(list)
-    error_occurred = pyqtSignal(str)
-
-    def run(self):
-        # 1. Fetch Dashboard
-        dash = APIClient.get_dashboard_data()
-        if dash:
-            self.data_ready.emit(dash)
-        else:
-            self.error_occurred.emit("No Data or Connection Failed")
-        
-        # 2. Fetch History
-        hist = APIClient.get_history()
-        if hist:
-            self.history_ready.emit(hist)
+from response_cache import ResponseCache
+from table_model import EquipmentTableModel
+from workers import FetchScheduler, ReportDownloadWorker, UploadWorker
 
 # --- LOGIN WINDOW ---
 class LoginWindow(QDialog):
@@ -78,7 +54,18 @@ class LoginWindow(QDialog):
         res = APIClient.login(u, p)
         if res and 'token' in res:
             APIClient.set_token(res['token'])
+            APIClient.use_cache(u)
             self.accept()
+        elif APIClient.OFFLINE and ResponseCache(BASE_URL, u).has_entries():
+            # Server unreachable: offer the data cached by this user's last session
+            answer = QMessageBox.question(
+                self, "Offline", "The server cannot be reached.\n"
+                "Open the data saved from your last session (read-only)?")
+            if answer == QMessageBox.Yes:
+                APIClient.use_cache(u)
+                self.accept()
+        elif APIClient.OFFLINE:
+            QMessageBox.critical(self, "Error", "The server cannot be reached")
         else:
             QMessageBox.critical(self, "Error", "Invalid Credentials")
 
@@ -95,6 +82,9 @@ class MainWindow(QMainWindow):
         self.main_layout.setContentsMargins(0, 0, 0, 0)
         self.main_layout.setSpacing(0)
 
+        # All API reads go through one scheduler; see workers.FetchScheduler
+        self.fetcher = FetchScheduler(self)
+
         self.setup_sidebar()
         
         self.content_stack = QStackedWidget()
@@ -110,7 +100,13 @@ class MainWindow(QMainWindow):
         self.status_label.setStyleSheet("padding: 5px;")
         self.statusBar.addWidget(self.status_label)
 
-        self.refresh_data()
+        self.fetcher.dashboard_ready.connect(self.update_ui)
+        self.fetcher.history_ready.connect(self.update_history)
+        self.fetcher.refresh_finished.connect(self.update_connection_state)
+
+        # Draw the last session's data straight away, then revalidate it
+        has_cached = self.render_cached()
+        self.refresh_data(emit_cached=not has_cached)
 
     def safe_add_widget(self, layout, widget):
         """Helper to prevent adding None widgets which crashes PyQt"""
@@ -157,6 +153,11 @@ class MainWindow(QMainWindow):
         
         self.main_layout.addWidget(sidebar)
 
+    def closeEvent(self, event):
+        # Don't keep the process alive for results nobody will see
+        self.fetcher.cancel()
+        super().closeEvent(event)
+
     def switch_tab(self, index):
         for i, btn in enumerate(self.nav_btns):
             btn.setChecked(i == index)
@@ -188,6 +189,7 @@ class MainWindow(QMainWindow):
         btn_upload.setCursor(Qt.PointingHandCursor)
         btn_upload.setStyleSheet("background-color: #1976D2; color: white; padding: 12px; font-weight: bold; border-radius: 4px;")
         btn_upload.clicked.connect(self.upload_file)
+        self.btn_upload = btn_upload
         
         self.safe_add_widget(ul_layout, QLabel("Drag CSV here or click to upload").setStyleSheet("color: #666; font-weight: bold;"))
         self.safe_add_widget(ul_layout, btn_upload)
@@ -211,8 +213,9 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(header)
         
-        self.chart_container = QVBoxLayout()
-        layout.addLayout(self.chart_container)
+        # Created once; refreshes update its artists in place
+        self.charts = DashboardCharts()
+        self.safe_add_widget(layout, self.charts)
         
         self.content_stack.addWidget(page)
 
@@ -221,7 +224,18 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout(page)
         self.safe_add_widget(layout, QLabel("Raw Data Logs").setStyleSheet("font-size: 24px; font-weight: bold; color: #333;"))
         
-        self.table = QTableWidget()
+        # Model-backed: only visible rows are rendered, more pages load while scrolling
+        self.table_model = EquipmentTableModel(self)
+        self.table_model.page_requested.connect(self.fetcher.fetch_page)
+        self.fetcher.page_ready.connect(self.table_model.append_page)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        # Fixed row heights spare the view from measuring every row
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.setStyleSheet("QHeaderView::section { background-color: #f0f0f0; padding: 5px; border: none; }")
         self.safe_add_widget(layout, self.table)
         self.content_stack.addWidget(page)
 
@@ -242,11 +256,28 @@ class MainWindow(QMainWindow):
         self.safe_add_widget(layout, scroll)
         self.content_stack.addWidget(page)
 
-    def refresh_data(self):
-        self.worker = DataFetchWorker()
-        self.worker.data_ready.connect(self.update_ui)
-        self.worker.history_ready.connect(self.update_history)
-        self.worker.start()
+    def render_cached(self):
+        """Shows the cached dashboard and history, if any. Returns whether it did."""
+        dash = APIClient.cached('dashboard')
+        hist = APIClient.cached('history')
+        if dash:
+            self.update_ui(dash)
+        if hist:
+            self.update_history(hist)
+        return bool(dash or hist)
+
+    def refresh_data(self, emit_cached=True, force=False):
+        self.fetcher.refresh(emit_cached, force)
+
+    def update_connection_state(self):
+        """Read-only mode while the server is unreachable: cached data, no uploads."""
+        self.btn_upload.setEnabled(not APIClient.OFFLINE)
+        if APIClient.OFFLINE:
+            entry = APIClient.CACHE.load('dashboard') if APIClient.CACHE else None
+            saved = f" from {entry['saved_at'][:16].replace('T', ' ')} UTC" if entry else ""
+            self.status_label.setText(f"Offline: showing saved data{saved} (read-only)")
+        elif self.status_label.text().startswith("Offline"):
+            self.status_label.setText("Ready")
 
     def update_ui(self, data):
         # 1. Update Stats
@@ -270,27 +301,11 @@ class MainWindow(QMainWindow):
             self.safe_add_widget(self.stats_layout, card)
             
         # 2. Update Charts
-        while self.chart_container.count():
-            item = self.chart_container.takeAt(0)
-            if item.widget(): item.widget().deleteLater()
-            
-        chart_widget = DashboardCharts(data)
-        self.safe_add_widget(self.chart_container, chart_widget)
+        self.charts.set_data(data)
         
-        # 3. Update Table
-        self.update_table(data['equipment_list'])
-
-    def update_table(self, rows):
-        self.table.setRowCount(len(rows))
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["ID", "Name", "Type", "Flow", "Pressure"])
-        self.table.setStyleSheet("QHeaderView::section { background-color: #f0f0f0; padding: 5px; border: none; }")
-        for r, item in enumerate(rows):
-            self.table.setItem(r, 0, QTableWidgetItem(str(item['equipment_id'])))
-            self.table.setItem(r, 1, QTableWidgetItem(str(item['name'])))
-            self.table.setItem(r, 2, QTableWidgetItem(str(item['type'])))
-            self.table.setItem(r, 3, QTableWidgetItem(str(item['flowrate'])))
-            self.table.setItem(r, 4, QTableWidgetItem(str(item['pressure'])))
+        # 3. Update Table (first page; the rest loads on demand, in upload order)
+        self.table_model.reset(data.get('equipment_page'), summary['id'])
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
 
     def update_history(self, history):
         while self.history_list_layout.count():
@@ -320,18 +335,50 @@ class MainWindow(QMainWindow):
             self.safe_add_widget(self.history_list_layout, card)
 
     def upload_file(self):
-        path, _ = QFileDialog.getOpenFileName(self, "CSV", "", "*.csv")
+        path, _ = QFileDialog.getOpenFileName(self, "CSV", "", "CSV (*.csv *.csv.gz)")
         if path:
-            self.status_label.setText(f"Uploading {os.path.basename(path)}...")
+            self.status_label.setText(f"Compressing {os.path.basename(path)}...")
             self.u_worker = UploadWorker(path)
-            self.u_worker.finished.connect(lambda s, m: (QMessageBox.information(self, "Info", m), self.refresh_data()))
+            self.u_worker.sent.connect(
+                lambda done, total: self.status_label.setText(
+                    f"Uploading {os.path.basename(path)}: {100 * done // max(total, 1)}% of {total / 2 ** 20:.1f} MB"))
+            self.u_worker.progress.connect(
+                lambda done, total: self.status_label.setText(f"Ingesting {os.path.basename(path)}: {done}/{total} rows"))
+            self.u_worker.finished.connect(lambda s, m: (QMessageBox.information(self, "Info", m), self.refresh_data(force=True)))
             self.u_worker.start()
 
     def download_report(self):
+        if getattr(self, 'd_worker', None) and self.d_worker.isRunning():
+            self.d_progress.show()
+            return
         path, _ = QFileDialog.getSaveFileName(self, "PDF", "report.pdf", "*.pdf")
         if path:
-            APIClient.download_pdf(path)
-            QMessageBox.information(self, "Info", "Saved!")
+            # The server may take a while to render; the window stays responsive meanwhile
+            self.d_progress = QProgressDialog("Preparing report...", "Cancel", 0, 0, self)
+            self.d_progress.setWindowTitle("Download Report")
+            self.d_progress.setMinimumDuration(0)
+            self.d_worker = ReportDownloadWorker(path)
+            self.d_worker.progress.connect(self.update_download_progress)
+            self.d_worker.finished.connect(self.download_finished)
+            self.d_progress.canceled.connect(self.d_worker.cancel)
+            self.d_worker.start()
+
+    def update_download_progress(self, received, total):
+        if total:
+            self.d_progress.setMaximum(total)
+            self.d_progress.setValue(received)
+        self.d_progress.setLabelText(f"Downloading report: {received // 1024} KB"
+                                     + (f" of {total // 1024} KB" if total else ""))
+
+    def download_finished(self, success, msg):
+        self.d_progress.reset()
+        self.d_progress.hide()
+        if success:
+            QMessageBox.information(self, "Info", f"Saved! {msg}")
+        elif msg == "Download cancelled":
+            self.status_label.setText("Report download cancelled; it resumes on the next download")
+        else:
+            QMessageBox.critical(self, "Error", msg)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
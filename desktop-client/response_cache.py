@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+APP_DIR = "chemical-visualizer"
+
+def default_cache_root():
+    """Per-user cache directory of the platform (overridable with CEV_CACHE_DIR)."""
+    if os.environ.get('CEV_CACHE_DIR'):
+        return os.environ['CEV_CACHE_DIR']
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, APP_DIR)
+
+class ResponseCache:
+    """
+    On-disk copy of the last responses the client rendered (dashboard,
+    history, PDF report), kept per server and user together with the ETag
+    each was served with, so the next launch can draw immediately,
+    revalidate with If-None-Match, and still show something offline.
+
+    Every write goes to a temporary file that is renamed into place, so a
+    crash never leaves a torn entry behind.
+    """
+
+    def __init__(self, server, username, root=None):
+        key = hashlib.sha256(f"{server}|{username}".encode()).hexdigest()[:32]
+        self.directory = os.path.join(root or default_cache_root(), key)
+
+    def _path(self, name, suffix):
+        return os.path.join(self.directory, f"{name}{suffix}")
+
+    def _replace(self, path, write):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def load(self, name):
+        """Returns {'etag', 'saved_at', 'data'} for an entry, or None."""
+        try:
+            with open(self._path(name, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, name, etag, data):
+        entry = {'etag': etag, 'saved_at': datetime.now(timezone.utc).isoformat(), 'data': data}
+        payload = json.dumps(entry).encode('utf-8')
+        self._replace(self._path(name, '.json'), lambda f: f.write(payload))
+
+    def update(self, name, data):
+        """Replaces an entry's data but keeps its ETag (e.g. to add derived fields)."""
+        entry = self.load(name)
+        if entry is not None:
+            self.store(name, entry['etag'], data)
+
+    def file_path(self, name):
+        """Path of a binary entry (e.g. the PDF report), or None if not cached."""
+        path = self._path(name, '.bin')
+        return path if os.path.exists(path) and self.load(name) is not None else None
+
+    def partial(self, name):
+        """(path, etag, size) of an interrupted download of a binary entry, or None."""
+        entry = self.load(f"{name}.part")
+        path = self._path(name, '.part')
+        if entry is None or not os.path.exists(path):
+            return None
+        return path, entry['etag'], os.path.getsize(path)
+
+    def open_partial(self, name, etag, resume=False):
+        """Opens the download file of a binary entry, appending to it when resuming."""
+        if not resume:
+            self.store(f"{name}.part", etag, None)
+        return open(self._path(name, '.part'), 'ab' if resume else 'wb')
+
+    def complete_partial(self, name):
+        """Turns a finished download into the binary entry and returns its path."""
+        entry = self.load(f"{name}.part")
+        path = self._path(name, '.bin')
+        os.replace(self._path(name, '.part'), path)
+        self.store(name, entry['etag'], None)
+        os.remove(self._path(f"{name}.part", '.json'))
+        return path
+
+    def has_entries(self):
+        return self.load('dashboard') is not None or self.load('history') is not None
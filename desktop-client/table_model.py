@@ -0,0 +1,134 @@
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+from api_client import APIClient
+
+class EquipmentTableModel(QAbstractTableModel):
+    """
+    Virtualized model behind the Data Logs table.
+
+    Rows are kept column-wise (one list per field) and the view only asks
+    for the cells it is about to paint, so a page of any size costs the GUI
+    thread a list extend rather than one widget item per cell. Further
+    cursor pages are requested through canFetchMore()/fetchMore() as the
+    user scrolls near the end; the owner runs the request off the GUI
+    thread and hands the result to append_page().
+
+    Sorting is done by the server (`?ordering=`): the loaded rows are
+    dropped and the first page is fetched again in the new order, so the
+    order covers the whole upload and later pages simply continue it.
+    """
+    COLUMNS = (
+        ('equipment_id', "ID"),
+        ('name', "Name"),
+        ('type', "Type"),
+        ('flowrate', "Flow"),
+        ('pressure', "Pressure"),
+    )
+    NUMERIC = {'flowrate', 'pressure'}
+
+    # Emitted with the next page URL when the view wants more rows
+    page_requested = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._fields = self.fields()
+        self._columns = {field: [] for field in self._fields}
+        self._upload_id = None
+        self._ordering = None  # server `ordering` param while sorted, else None
+        self._next_url = None
+        self._pending_url = None
+
+    @classmethod
+    def fields(cls):
+        """Fields to request from the equipment endpoint."""
+        return [field for field, _ in cls.COLUMNS]
+
+    # --- Data loading ---
+    def reset(self, page, upload_id=None):
+        """
+        Replaces the contents with the first page of a (new) upload. That
+        page is in upload order, so any sort is cleared.
+        """
+        self._upload_id = upload_id
+        self._ordering = None
+        self._clear()
+        self.append_page(page)
+
+    def _clear(self, next_url=None):
+        self.beginResetModel()
+        self._columns = {field: [] for field in self._fields}
+        self._next_url = next_url
+        self._pending_url = None
+        self.endResetModel()
+
+    def append_page(self, page, url=None):
+        """
+        Adds a fetched cursor page. `url` is the page_requested URL it was
+        fetched from; pages of a request made before the last reset() are
+        dropped. None (a failed fetch) lets the view request it again.
+        """
+        if url is not None:
+            if url != self._pending_url:
+                return
+            self._pending_url = None
+        if not page:
+            return
+        rows = page['results']
+        self._next_url = page['next']
+        if not rows:
+            return
+
+        start = len(self._columns[self._fields[0]])
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        for field in self._fields:
+            self._columns[field].extend(row[field] for row in rows)
+        self.endInsertRows()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and bool(self._next_url) and self._pending_url is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._pending_url = self._next_url
+            self.page_requested.emit(self._next_url)
+
+    # --- Qt model interface ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns[self._fields[0]])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._fields)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        field = self._fields[index.column()]
+        if role == Qt.DisplayRole:
+            return str(self._columns[field][index.row()])
+        if role == Qt.TextAlignmentRole and field in self.NUMERIC:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.COLUMNS[section][1]
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        Refetches the rows from the first page, sorted by the server;
+        column -1 restores the upload order.
+        """
+        ordering = None
+        if column >= 0:
+            field = self._fields[column]
+            ordering = f"-{field}" if order == Qt.DescendingOrder else field
+        if ordering == self._ordering or self._upload_id is None:
+            self._ordering = ordering
+            return
+
+        self._ordering = ordering
+        # fetchMore() requests it; a failed fetch leaves it to be requested again
+        self._clear(APIClient.equipment_page_url(self._upload_id, ordering=ordering, fields=self._fields))
+        self.fetchMore()
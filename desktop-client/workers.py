@@ -1,25 +1,211 @@
-from PyQt5.QtCore import QThread, pyqtSignal
+import time
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, pyqtSignal
 from api_client import APIClient
+from table_model import EquipmentTableModel
 
 class UploadWorker(QThread):
     finished = pyqtSignal(bool, str) # Signal sends back (Success?, Message)
+    sent = pyqtSignal(int, int) # (bytes sent, total bytes) while transferring
+    progress = pyqtSignal(int, int) # (processed_rows, total_rows)
+    POLL_INTERVAL_MS = 500
+    # Give up on a job whose status and progress stop changing for this long
+    STALL_TIMEOUT_S = 300
 
     def __init__(self, file_path):
         super().__init__()
         self.file_path = file_path
 
     def run(self):
-        # This runs in a background thread
-        success, message = APIClient.upload_file(self.file_path)
-        self.finished.emit(success, message)
+        success, job = APIClient.upload_file(self.file_path, progress=self.sent.emit)
+        if not success:
+            self.finished.emit(False, job)
+            return
 
-class DataFetchWorker(QThread):
-    data_ready = pyqtSignal(dict) 
-    error_occurred = pyqtSignal(str)
+        # Ingestion runs server-side; poll the job until it settles
+        last_state, last_change = None, time.monotonic()
+        while job['status'] in ('queued', 'running'):
+            self.msleep(self.POLL_INTERVAL_MS)
+            job = APIClient.get_job(job['id'])
+            if job is None:
+                self.finished.emit(False, "Lost contact with the ingestion job")
+                return
+            self.progress.emit(job['processed_rows'], job['total_rows'] or 0)
+
+            state = (job['status'], job['processed_rows'])
+            if state != last_state:
+                last_state, last_change = state, time.monotonic()
+            elif time.monotonic() - last_change > self.STALL_TIMEOUT_S:
+                self.finished.emit(False, "The ingestion job stopped making progress")
+                return
+
+        if job['status'] == 'completed':
+            self.finished.emit(True, f"Upload Successful ({job['processed_rows']} records)")
+        else:
+            self.finished.emit(False, f"Failed: {job['error']}")
+
+class ReportDownloadWorker(QThread):
+    finished = pyqtSignal(bool, str) # (Success?, Message)
+    progress = pyqtSignal(int, int) # (bytes received, total bytes or 0 while unknown)
+
+    def __init__(self, save_path):
+        super().__init__()
+        self.save_path = save_path
+        self._cancelled = False
+
+    def cancel(self):
+        """Stops after the current chunk; the partial file is kept for a later resume."""
+        self._cancelled = True
 
     def run(self):
-        data = APIClient.get_dashboard_data()
-        if data:
-            self.data_ready.emit(data)
+        success, msg = APIClient.download_pdf(self.save_path, progress=self.progress.emit,
+                                              is_cancelled=lambda: self._cancelled)
+        self.finished.emit(success, msg)
+
+# Result of a task that was skipped because its generation was cancelled
+_CANCELLED = object()
+
+class _FetchTask(QRunnable):
+    """One request run on the scheduler's pool; skipped if cancelled before it starts."""
+
+    def __init__(self, scheduler, key, fn, callback):
+        super().__init__()
+        self.setAutoDelete(False)  # the scheduler holds it until its result is delivered
+        self.scheduler = scheduler
+        self.key = key
+        self.fn = fn
+        # Callers merged into this request get the same result
+        self.callbacks = [callback] if callback is not None else []
+        self.generation = scheduler.generation
+
+    def run(self):
+        result = _CANCELLED
+        if self.generation == self.scheduler.generation:
+            try:
+                result = self.fn()
+            except Exception as e:
+                print(f"Fetch Error ({self.key}): {e}")
+                result = None
+        self.scheduler._task_done.emit(self, result)
+
+class FetchScheduler(QObject):
+    """
+    Runs the window's API requests on a shared thread pool and hands the
+    results back on the GUI thread through its signals.
+
+    Independent requests (dashboard and history, then the top-N chart and
+    the first table page) run in parallel. A request whose key is already
+    in flight is merged into the running one, so repeated refreshes cost a
+    single round of requests. cancel(), or refresh(force=True) when the
+    data is known to have changed, moves to a new generation: queued
+    requests of the old one are skipped and the results of those already
+    running are discarded, so only the newest data reaches the UI.
+    """
+    dashboard_ready = pyqtSignal(dict)
+    history_ready = pyqtSignal(list)
+    page_ready = pyqtSignal(object, str) # (page or None on failure, requested url)
+    error_occurred = pyqtSignal(str)
+    refresh_finished = pyqtSignal() # every request of the current generation has settled
+
+    _task_done = pyqtSignal(object, object) # (task, result), queued to the GUI thread
+
+    def __init__(self, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.generation = 0
+        self._in_flight = {} # key -> task of the current generation
+        self._running = set() # every submitted task until its result is delivered
+        self._emit_cached = True
+        self._task_done.connect(self._on_task_done)
+
+    def _submit(self, key, fn, callback=None):
+        """
+        Runs fn() on the pool and callback(result) on the GUI thread. If `key`
+        is already in flight, callback just joins that request and False is
+        returned.
+        """
+        if key in self._in_flight:
+            if callback is not None:
+                self._in_flight[key].callbacks.append(callback)
+            return False
+        task = _FetchTask(self, key, fn, callback)
+        self._in_flight[key] = task
+        self._running.add(task)
+        self.pool.start(task)
+        return True
+
+    def _on_task_done(self, task, result):
+        self._running.discard(task)
+        if task.generation != self.generation or result is _CANCELLED:
+            return
+        if self._in_flight.get(task.key) is task:
+            del self._in_flight[task.key]
+        for callback in task.callbacks:
+            callback(result)
+        if not self._in_flight:
+            self.refresh_finished.emit()
+
+    def cancel(self):
+        """Drops queued requests and discards the results of running ones."""
+        self.generation += 1
+        self._in_flight.clear()
+        self.pool.clear()
+
+    def refresh(self, emit_cached=True, force=False):
+        """
+        Revalidates the dashboard and history. With emit_cached False an
+        unchanged (304) or offline answer is not re-emitted, because the
+        window already shows the cached copy.
+        """
+        if force:
+            self.cancel()
+        if not self._in_flight:
+            self._emit_cached = emit_cached
         else:
-            self.error_occurred.emit("No data available or connection failed.")
\ No newline at end of file
+            self._emit_cached = self._emit_cached or emit_cached
+        self._submit('dashboard', lambda: APIClient.fetch_cached('dashboard', '/dashboard/'), self._on_dashboard)
+        self._submit('history', lambda: APIClient.fetch_cached('history', '/history/'), self._on_history)
+
+    def fetch_page(self, url):
+        """Fetches a further equipment page; the result arrives through page_ready."""
+        self._submit(('page', url), lambda: APIClient.get_equipment_page(next_url=url),
+                     lambda page: self.page_ready.emit(page, url))
+
+    def _on_dashboard(self, result):
+        dash, fresh = result or (None, False)
+        if not dash:
+            self.error_occurred.emit("No Data or Connection Failed")
+            return
+        # A cached copy may have been stored without the extras below
+        if (fresh or 'equipment_page' not in dash) and not APIClient.OFFLINE:
+            self._fetch_dashboard_extras(dash)
+        elif self._emit_cached:
+            self.dashboard_ready.emit(dash)
+
+    def _fetch_dashboard_extras(self, dash):
+        """Fetches the critical pressure rows and the first table page in parallel, then emits the dashboard."""
+        upload_id = dash['summary']['id']
+        parts = {}
+
+        def collect(name):
+            def store(value):
+                parts[name] = value
+                if len(parts) < 2:
+                    return
+                dash['top_pressure'] = parts['top']['results'] if parts['top'] else []
+                dash['equipment_page'] = parts['page']
+                # Cache the first table page and top-N with the dashboard for the next launch
+                if APIClient.CACHE:
+                    self._submit('cache-dashboard', lambda: APIClient.CACHE.update('dashboard', dash))
+                self.dashboard_ready.emit(dash)
+            return store
+
+        self._submit(('top', upload_id), lambda: APIClient.get_critical_equipment(upload_id, 'pressure', limit=5),
+                     collect('top'))
+        self._submit(('first-page', upload_id), lambda: APIClient.get_equipment_page(
+            upload_id, fields=EquipmentTableModel.fields()), collect('page'))
+
+    def _on_history(self, result):
+        hist, fresh = result or (None, False)
+        if hist and (fresh or self._emit_cached):
+            self.history_ready.emit(hist)
@@ -15,6 +15,10 @@ function App() {
   const [activeTab, setActiveTab] = useState('overview');
   const [dashboardData, setDashboardData] = useState(null);
   const [historyData, setHistoryData] = useState([]);
+  const [equipmentRows, setEquipmentRows] = useState([]);
+  const [nextPageUrl, setNextPageUrl] = useState(null);
+  const [topPressure, setTopPressure] = useState([]);
+  const [typeSummary, setTypeSummary] = useState([]);
   const [loading, setLoading] = useState(true);
 
   // --- Auth Check on Load ---
@@ -37,6 +41,10 @@ function App() {
     setIsAuthenticated(false);
     setDashboardData(null);
     setHistoryData([]);
+    setEquipmentRows([]);
+    setNextPageUrl(null);
+    setTopPressure([]);
+    setTypeSummary([]);
   };
 
   // --- Data Fetching ---
@@ -46,6 +54,7 @@ function App() {
       const response = await api.getDashboardData();
       if (response.status !== 204) {
         setDashboardData(response.data);
+        await fetchEquipment(response.data.summary.id);
       }
     } catch (error) {
       console.error("Error fetching dashboard:", error);
@@ -54,6 +63,30 @@ function App() {
     }
   };
 
+  // Equipment rows are cursor-paginated; chart data comes pre-reduced from the server
+  const fetchEquipment = async (uploadId) => {
+    const [page, top, types] = await Promise.all([
+      api.getEquipmentPage(uploadId),
+      api.getCriticalEquipment(uploadId, { metric: 'pressure', limit: 5 }),
+      api.getTypeSummary(uploadId),
+    ]);
+    setEquipmentRows(page.data.results);
+    setNextPageUrl(page.data.next);
+    setTopPressure(top.data.results);
+    setTypeSummary(types.data);
+  };
+
+  const loadMoreEquipment = async () => {
+    if (!nextPageUrl) return;
+    try {
+      const page = await api.getNextPage(nextPageUrl);
+      setEquipmentRows((rows) => [...rows, ...page.data.results]);
+      setNextPageUrl(page.data.next);
+    } catch (error) {
+      console.error("Error fetching equipment page:", error);
+    }
+  };
+
   const fetchHistoryData = async () => {
     try {
       const response = await api.getHistory();
@@ -110,7 +143,7 @@ function App() {
             </div>
             <div>
               <h3 className="text-lg font-semibold text-slate-800 mb-4">Visual Trends</h3>
-              <ChartsSection distribution={dashboardData.distribution} equipmentList={dashboardData.equipment_list} />
+              <ChartsSection distribution={dashboardData.distribution} topPressure={topPressure} />
             </div>
             <div className="bg-white rounded-xl border border-slate-200 p-6 shadow-sm">
                   <h3 className="font-semibold text-slate-800 mb-4">Upload New Data</h3>
@@ -128,8 +161,8 @@ function App() {
                         <FileDown size={16} /> Download PDF Report
                      </button>
                 </div>
-                <AnalyticsCharts equipmentList={dashboardData.equipment_list} />
-                <ChartsSection distribution={dashboardData.distribution} equipmentList={dashboardData.equipment_list} />
+                <AnalyticsCharts equipmentList={equipmentRows} typeSummary={typeSummary} />
+                <ChartsSection distribution={dashboardData.distribution} topPressure={topPressure} />
             </div>
         );
 
@@ -139,7 +172,7 @@ function App() {
                 <div className="flex justify-between items-center bg-white p-4 rounded-xl border border-slate-200 shadow-sm">
                     <h2 className="text-xl font-bold text-slate-800">Raw Data Logs</h2>
                 </div>
-                <DataTable data={dashboardData.equipment_list} />
+                <DataTable data={equipmentRows} onLoadMore={nextPageUrl ? loadMoreEquipment : null} />
             </div>
         );
 
@@ -4,7 +4,7 @@ import { Radar, Scatter } from 'react-chartjs-2';
 
 ChartJS.register(RadialLinearScale, PointElement, LineElement, Filler, Tooltip, Legend);
 
-const AnalyticsCharts = ({ equipmentList }) => {
+const AnalyticsCharts = ({ equipmentList, typeSummary = [] }) => {
   if (!equipmentList) return null;
 
   // Prepare Scatter Data: Flowrate vs Pressure
@@ -31,24 +31,14 @@ const AnalyticsCharts = ({ equipmentList }) => {
     plugins: { legend: { position: 'top' } }
   };
 
-  // Prepare Radar Data: Average Metrics by Type
-  // We need to aggregate data manually here
-  const types = [...new Set(equipmentList.map(e => e.type))];
-  const radarDatasets = types.map((type, i) => {
-      const items = equipmentList.filter(e => e.type === type);
-      const avgFlow = items.reduce((acc, curr) => acc + curr.flowrate, 0) / items.length;
-      const avgPress = items.reduce((acc, curr) => acc + curr.pressure, 0) / items.length;
-      const avgTemp = items.reduce((acc, curr) => acc + curr.temperature, 0) / items.length;
-      
-      // Normalize slightly for visualization if scales are wildly different
-      // For this demo, we plot raw values assuming they are somewhat comparable orders of magnitude
-      
+  // Prepare Radar Data: Average Metrics by Type (aggregated on the server)
+  const radarDatasets = typeSummary.map((summary, i) => {
       const colors = ['rgba(59, 130, 246, 0.2)', 'rgba(239, 68, 68, 0.2)', 'rgba(16, 185, 129, 0.2)'];
       const borderColors = ['#3b82f6', '#ef4444', '#10b981'];
       
       return {
-          label: type,
-          data: [avgFlow, avgPress, avgTemp],
+          label: summary.type,
+          data: [summary.flowrate.mean, summary.pressure.mean, summary.temperature.mean],
           backgroundColor: colors[i % 3],
           borderColor: borderColors[i % 3],
           borderWidth: 2,
@@ -5,8 +5,8 @@ import { Doughnut, Bar } from 'react-chartjs-2';
 // Register ChartJS components
 ChartJS.register(ArcElement, Tooltip, Legend, CategoryScale, LinearScale, BarElement);
 
-const ChartsSection = ({ distribution, equipmentList }) => {
-  if (!distribution || !equipmentList) return null;
+const ChartsSection = ({ distribution, topPressure }) => {
+  if (!distribution || !topPressure) return null;
 
   // Prepare Data for Doughnut Chart 
   const pieData = {
@@ -27,9 +27,9 @@ const ChartsSection = ({ distribution, equipmentList }) => {
     ],
   };
 
-  // Prepare Data for Bar Chart (Top 5 Highest Pressure Equipment)
-  // Sorting to show the most critical equipment
-  const sortedByPressure = [...equipmentList].sort((a, b) => b.pressure - a.pressure).slice(0, 5);
+  // Prepare Data for Bar Chart (Top 5 Critical Pressure Equipment)
+  // Flagged at ingest and returned already sorted, most critical first
+  const sortedByPressure = topPressure;
   
   const barData = {
     labels: sortedByPressure.map(d => d.name),
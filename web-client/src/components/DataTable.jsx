@@ -1,6 +1,6 @@
 import React from 'react';
 
-const DataTable = ({ data }) => {
+const DataTable = ({ data, onLoadMore }) => {
   if (!data || data.length === 0) return null;
 
   return (
@@ -38,6 +38,13 @@ const DataTable = ({ data }) => {
           </tbody>
         </table>
       </div>
+      {onLoadMore && (
+        <div className="p-4 border-t border-gray-100 text-center">
+          <button onClick={onLoadMore} className="bg-slate-900 text-white px-4 py-2 rounded-lg text-sm font-medium hover:bg-slate-800 transition-colors">
+            Load More
+          </button>
+        </div>
+      )}
     </div>
   );
 };
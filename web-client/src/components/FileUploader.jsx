@@ -2,6 +2,30 @@ import React, { useState } from 'react';
 import { UploadCloud, Loader2, CheckCircle, AlertCircle } from 'lucide-react';
 import { api } from '../services/api';
 
+const JOB_POLL_INTERVAL_MS = 500;
+// Give up on a job whose status and progress stop changing for this long
+const JOB_STALL_TIMEOUT_MS = 5 * 60 * 1000;
+
+// Uploads are ingested in the background; poll the job until it settles
+const waitForJob = async (job) => {
+  let lastState = null;
+  let lastChange = Date.now();
+  while (job.status === 'queued' || job.status === 'running') {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    job = (await api.getJob(job.id)).data;
+
+    const state = `${job.status}:${job.processed_rows}`;
+    if (state !== lastState) {
+      lastState = state;
+      lastChange = Date.now();
+    } else if (Date.now() - lastChange > JOB_STALL_TIMEOUT_MS) {
+      throw new Error('The ingestion job stopped making progress');
+    }
+  }
+  if (job.status !== 'completed') throw new Error(job.error);
+  return job;
+};
+
 const FileUploader = ({ onUploadSuccess, compact = false }) => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
@@ -16,7 +40,8 @@ const FileUploader = ({ onUploadSuccess, compact = false }) => {
     setSuccess(false);
 
     try {
-      await api.uploadFile(file);
+      const response = await api.uploadFile(file);
+      await waitForJob(response.data);
       setSuccess(true);
       onUploadSuccess();
       setTimeout(() => setSuccess(false), 3000);
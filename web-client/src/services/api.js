@@ -32,7 +32,17 @@ export const api = {
             headers: { 'Content-Type': 'multipart/form-data' },
         });
     },
+    getJob: (jobId) => apiClient.get(`/jobs/${jobId}/`),
     getDashboardData: () => apiClient.get('/dashboard/'),
+    getEquipmentPage: (uploadId, params = {}) => apiClient.get(`/uploads/${uploadId}/equipment/`, { params }),
+    // Cursor pages link to their successor with an absolute URL
+    getNextPage: (url) => apiClient.get(url),
+    // Chart data, reduced on the server
+    getTopEquipment: (uploadId, params = {}) => apiClient.get(`/uploads/${uploadId}/charts/top/`, { params }),
+    getHistogram: (uploadId, params = {}) => apiClient.get(`/uploads/${uploadId}/charts/histogram/`, { params }),
+    getTypeSummary: (uploadId) => apiClient.get(`/uploads/${uploadId}/charts/types/`),
+    // Rows flagged at ingest (operating limits and z-score outliers)
+    getCriticalEquipment: (uploadId, params = {}) => apiClient.get(`/uploads/${uploadId}/critical/`, { params }),
     getHistory: () => apiClient.get('/history/'),
     downloadPDF: () => apiClient.get('/report/pdf/', { responseType: 'blob' }),
 };